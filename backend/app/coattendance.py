@@ -0,0 +1,228 @@
+import threading
+import time
+from array import array
+from collections import defaultdict
+from datetime import datetime, timezone
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return 0.0
+
+
+def _csr(num_rows, edges):
+    """Pack (row, col) edges into compressed sparse row arrays (indptr, indices)."""
+    counts = [0] * (num_rows + 1)
+    for row, _ in edges:
+        counts[row + 1] += 1
+    for i in range(num_rows):
+        counts[i + 1] += counts[i]
+    indptr = array("l", counts)
+    indices = array("l", [0]) * len(edges)
+    cursor = list(counts[:-1])
+    for row, col in edges:
+        indices[cursor[row]] = col
+        cursor[row] += 1
+    return indptr, indices
+
+
+class CoAttendanceGraph:
+    """
+    User-event bipartite graph of who is going to what.
+
+    The bulk of the adjacency lives in two CSR structures (user -> events and
+    event -> users) rebuilt from Mongo. New attendance goes into a small overlay
+    and removed attendance into a set of dropped edges; both are folded back
+    into the CSR arrays once they grow past compact_threshold.
+    """
+
+    def __init__(self, recency_half_life_days=30, compact_threshold=5000):
+        self.recency_half_life = recency_half_life_days * 86400
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._user_ids = []
+        self._user_index = {}
+        self._event_ids = []
+        self._event_index = {}
+        self._event_times = array("d")
+        self._user_ptr, self._user_events = array("l", [0]), array("l")
+        self._event_ptr, self._event_users = array("l", [0]), array("l")
+        self._extra_user_events = defaultdict(list)
+        self._extra_event_users = defaultdict(list)
+        self._removed = set()  # (user, event) edges dropped from the CSR arrays
+        self._pending = 0
+
+    def _user(self, user_id):
+        user_id = str(user_id)
+        idx = self._user_index.get(user_id)
+        if idx is None:
+            idx = self._user_index[user_id] = len(self._user_ids)
+            self._user_ids.append(user_id)
+        return idx
+
+    def _event(self, event_id, event_time=None):
+        event_id = str(event_id)
+        idx = self._event_index.get(event_id)
+        if idx is None:
+            idx = self._event_index[event_id] = len(self._event_ids)
+            self._event_ids.append(event_id)
+            self._event_times.append(_timestamp(event_time))
+        elif event_time is not None:
+            self._event_times[idx] = _timestamp(event_time)
+        return idx
+
+    def _events_of(self, u):
+        if u + 1 < len(self._user_ptr):
+            events = self._user_events[self._user_ptr[u]:self._user_ptr[u + 1]]
+            if self._removed:
+                events = [e for e in events if (u, e) not in self._removed]
+            yield from events
+        yield from self._extra_user_events.get(u, ())
+
+    def _users_of(self, e):
+        if e + 1 < len(self._event_ptr):
+            users = self._event_users[self._event_ptr[e]:self._event_ptr[e + 1]]
+            if self._removed:
+                users = [u for u in users if (u, e) not in self._removed]
+            yield from users
+        yield from self._extra_event_users.get(e, ())
+
+    def build(self, db):
+        """Rebuild the whole graph from the events and event_attendance collections."""
+        with self._lock:
+            self._reset()
+            for event in db.events.find({}, {"time": 1}):
+                self._event(event["_id"], event.get("time"))
+            edges = []
+            for row in db.event_attendance.find({}, {"event_id": 1, "user_id": 1}):
+                edges.append((self._user(row["user_id"]), self._event(row["event_id"])))
+            self._pack(edges)
+        return self
+
+    def sync(self, db, since):
+        """
+        Apply attendance added or removed at or after since, oldest first, so a
+        leave followed by a re-join ends up attending. Removals are read from the
+        attendance_removals tombstones written by removeAttendance.
+        """
+        changes = [
+            (row["joined_at"], True, row["event_id"], row["user_id"])
+            for row in db.event_attendance.find({"joined_at": {"$gte": since}}, {"event_id": 1, "user_id": 1, "joined_at": 1})
+        ]
+        changes += [
+            (row["removed_at"], False, row["event_id"], row["user_id"])
+            for row in db.attendance_removals.find({"removed_at": {"$gte": since}}, {"event_id": 1, "user_id": 1, "removed_at": 1})
+        ]
+        if not changes:
+            return self
+
+        with self._lock:
+            unknown = list({event_id for _, added, event_id, _ in changes if added and str(event_id) not in self._event_index})
+        times = {e["_id"]: e.get("time") for e in db.events.find({"_id": {"$in": unknown}}, {"time": 1})} if unknown else {}
+
+        changes.sort(key=lambda change: (change[0], change[1]))
+        for _, added, event_id, user_id in changes:
+            if added:
+                self.add_attendance(event_id, user_id, times.get(event_id))
+            else:
+                self.remove_attendance(event_id, user_id)
+        return self
+
+    def _pack(self, edges):
+        edges = sorted(set(edges))
+        self._user_ptr, self._user_events = _csr(len(self._user_ids), edges)
+        self._event_ptr, self._event_users = _csr(len(self._event_ids), [(e, u) for u, e in edges])
+        self._extra_user_events.clear()
+        self._extra_event_users.clear()
+        self._removed.clear()
+        self._pending = 0
+
+    def _compact(self):
+        edges = [(u, e) for u in range(len(self._user_ids)) for e in self._events_of(u)]
+        self._pack(edges)
+
+    def add_attendance(self, event_id, user_id, event_time=None):
+        with self._lock:
+            e = self._event(event_id, event_time)
+            u = self._user(user_id)
+            if (u, e) in self._removed:
+                # Still packed in the CSR arrays, so un-drop it
+                self._removed.discard((u, e))
+                return True
+            if e in self._events_of(u):
+                return False
+            self._extra_user_events[u].append(e)
+            self._extra_event_users[e].append(u)
+            self._pending += 1
+            if self._pending >= self.compact_threshold:
+                self._compact()
+            return True
+
+    def remove_attendance(self, event_id, user_id):
+        with self._lock:
+            u = self._user_index.get(str(user_id))
+            e = self._event_index.get(str(event_id))
+            if u is None or e is None:
+                return False
+            if e in self._extra_user_events.get(u, ()):
+                self._extra_user_events[u].remove(e)
+                self._extra_event_users[e].remove(u)
+                self._pending -= 1
+                return True
+            if e not in self._events_of(u):
+                return False
+            self._removed.add((u, e))
+            self._pending += 1
+            if self._pending >= self.compact_threshold:
+                self._compact()
+            return True
+
+    def events_for_user(self, user_id):
+        with self._lock:
+            u = self._user_index.get(str(user_id))
+            if u is None:
+                return []
+            return [self._event_ids[e] for e in self._events_of(u)]
+
+    def rank_candidates(self, user_id, limit=20, now=None):
+        """
+        Rank users who share events with user_id, in a single pass over their events.
+
+        Candidates are ordered by number of shared events, then by a recency score in
+        which each shared event counts 1 at `now` and halves every half-life away.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            u = self._user_index.get(str(user_id))
+            if u is None:
+                return []
+
+            shared = defaultdict(int)
+            recency = defaultdict(float)
+            last_shared = {}
+            for e in self._events_of(u):
+                event_time = self._event_times[e]
+                weight = 0.5 ** (abs(now - event_time) / self.recency_half_life) if event_time else 0.0
+                for v in self._users_of(e):
+                    if v == u:
+                        continue
+                    shared[v] += 1
+                    recency[v] += weight
+                    last_shared[v] = max(last_shared.get(v, 0.0), event_time)
+
+            ranked = sorted(shared, key=lambda v: (shared[v], recency[v]), reverse=True)[:limit]
+            return [
+                {
+                    "user_id": self._user_ids[v],
+                    "shared_events": shared[v],
+                    "recency_score": round(recency[v], 4),
+                    "last_shared_at": datetime.fromtimestamp(last_shared[v], timezone.utc).strftime("%Y-%m-%dT%H:%M") if last_shared[v] else None
+                }
+                for v in ranked
+            ]
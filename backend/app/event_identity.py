@@ -0,0 +1,171 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# Filler words Gemini adds or drops between runs ("Alcatraz Island" vs "Alcatraz Island Tour")
+_FILLER_WORDS = {"the", "a", "an", "at", "of", "and", "tour", "tours", "visit", "trip", "experience"}
+
+# Same-name events further apart than this are different events ("Dinner" at 12:00 vs 20:00)
+EVENT_IDENTITY_WINDOW_MINUTES = int(os.getenv("EVENT_IDENTITY_WINDOW_MINUTES", "120"))
+
+# Case-insensitive match on events.location, backed by an index with the same collation
+CITY_COLLATION = {"locale": "en", "strength": 2}
+
+
+def normalize_name(name):
+    text = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().lower()
+    words = re.sub(r"[^a-z0-9]+", " ", text).split()
+    return " ".join(w for w in words if w not in _FILLER_WORDS)
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def trigram_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def numbers(words):
+    return {w for w in words if any(ch.isdigit() for ch in w)}
+
+
+class EventIdentityIndex:
+    """
+    Resolves slightly different names for the same event to one canonical event id.
+
+    Events are bucketed per city and day. A lookup only considers events in the
+    city that start within `window` of the requested time. It first tries the
+    normalized name as an exact key, then falls back to trigram similarity, so
+    each lookup only touches a handful of events. A fuzzy match needs the same
+    numbers in both names ("Pier 33" is not "Pier 39") and a score above
+    `threshold` when one name's words contain the other's ("Twin Peaks Hike"),
+    or above `respelled_threshold` otherwise ("Market Place" vs "Marketplace",
+    but not "Nopalito" vs "Nopa"). Names made only of filler words are matched
+    exactly on their raw text and never fuzzily.
+    Cities are loaded from Mongo on first use and kept current through add().
+    A miss re-reads the days around the requested time from Mongo before
+    answering, so events inserted by other workers are still found.
+    """
+
+    def __init__(self, threshold=0.6, respelled_threshold=0.8, window=None):
+        self.threshold = threshold
+        self.respelled_threshold = respelled_threshold
+        self.window = window or timedelta(minutes=EVENT_IDENTITY_WINDOW_MINUTES)
+        self._cities = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _city_key(location):
+        return (location or "").strip().lower()
+
+    @staticmethod
+    def _name_key(name):
+        normalized = normalize_name(name)
+        if normalized:
+            return normalized, trigrams(normalized)
+        return " ".join((name or "").lower().split()), None
+
+    def _load_city(self, db, location):
+        buckets = defaultdict(list)
+        events = db.events.find({"location": location.strip()}, {"name": 1, "time": 1}).collation(CITY_COLLATION)
+        for event in events:
+            self._add_to_buckets(buckets, event["_id"], event.get("name"), event.get("time"))
+        return buckets
+
+    @classmethod
+    def _add_to_buckets(cls, buckets, event_id, name, event_time):
+        if event_time is None:
+            return
+        key, grams = cls._name_key(name)
+        buckets[event_time.date()].append((str(event_id), key, grams, event_time))
+
+    def _city(self, db, location):
+        key = self._city_key(location)
+        with self._lock:
+            buckets = self._cities.get(key)
+            if buckets is None:
+                buckets = self._cities[key] = self._load_city(db, location)
+            return buckets
+
+    def _reload_days(self, db, location, buckets, event_time):
+        """Replace the buckets for the days within the window of event_time with what Mongo has."""
+        first_day = (event_time - self.window).date()
+        last_day = (event_time + self.window).date()
+        fresh = defaultdict(list)
+        events = db.events.find(
+            {
+                "location": location.strip(),
+                "time": {
+                    "$gte": datetime.combine(first_day, datetime.min.time()),
+                    "$lt": datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+                }
+            },
+            {"name": 1, "time": 1}
+        ).collation(CITY_COLLATION)
+        for event in events:
+            self._add_to_buckets(fresh, event["_id"], event.get("name"), event.get("time"))
+        with self._lock:
+            day = first_day
+            while day <= last_day:
+                buckets[day] = fresh.get(day, [])
+                day += timedelta(days=1)
+
+    def _nearby(self, buckets, event_time):
+        """Entries starting within the window of event_time, closest first."""
+        days = {(event_time + offset).date() for offset in (-self.window, timedelta(0), self.window)}
+        entries = [
+            entry
+            for day in days
+            for entry in buckets.get(day, ())
+            if abs(entry[3] - event_time) <= self.window
+        ]
+        return sorted(entries, key=lambda entry: abs(entry[3] - event_time))
+
+    def resolve(self, db, name, location, event_time):
+        """Return the canonical event id for (name, location, time), or None if it's new."""
+        buckets = self._city(db, location)
+        event_id = self._match(buckets, name, event_time)
+        if event_id is None:
+            # Before calling it new, catch up on events other workers inserted
+            self._reload_days(db, location, buckets, event_time)
+            event_id = self._match(buckets, name, event_time)
+        return event_id
+
+    def _match(self, buckets, name, event_time):
+        key, grams = self._name_key(name)
+        with self._lock:
+            nearby = self._nearby(buckets, event_time)
+            for event_id, entry_key, _, _ in nearby:
+                if entry_key == key:
+                    return event_id
+            if grams is None:
+                return None
+
+            words = set(key.split())
+            best_id, best_score = None, 0.0
+            for event_id, entry_key, entry_grams, _ in nearby:
+                if entry_grams is None:
+                    continue
+                entry_words = set(entry_key.split())
+                if numbers(words) != numbers(entry_words):
+                    continue
+                nested = words <= entry_words or entry_words <= words
+                score = trigram_similarity(grams, entry_grams)
+                # nearby is closest first, so ties go to the event closest in time
+                if score > (self.threshold if nested else self.respelled_threshold) and score > best_score:
+                    best_id, best_score = event_id, score
+            return best_id
+
+    def add(self, event_id, name, location, event_time):
+        """Index a newly inserted event; cities not loaded yet will pick it up from Mongo."""
+        with self._lock:
+            buckets = self._cities.get(self._city_key(location))
+            if buckets is not None:
+                self._add_to_buckets(buckets, event_id, name, event_time)
@@ -0,0 +1,55 @@
+import threading
+from datetime import datetime, timedelta
+
+# Rows are stamped with the writing host's clock, so each sync re-reads a little
+# before the last watermark; applying a row twice is a no-op for every index
+CLOCK_SKEW = timedelta(seconds=60)
+
+
+class IndexRefresher:
+    """
+    Periodically folds other workers' writes into a process's in-memory indexes.
+
+    Each worker only applies its own writes to its indexes directly. Every
+    interval, this asks each index to sync(db, since) the rows stamped after the
+    last watermark, so a refresh costs what changed rather than a full rebuild.
+    Indexes are updated in place under their own locks.
+    """
+
+    def __init__(self, app, db, keys, since, interval=60.0):
+        self.app = app
+        self.db = db
+        self.keys = list(keys)  # app.config keys of indexes that have sync(db, since)
+        self.since = since      # naive UTC time the indexes are known to be current at
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def refresh(self):
+        started = datetime.utcnow()
+        ok = True
+        for key in self.keys:
+            try:
+                self.app.config[key].sync(self.db, self.since - CLOCK_SKEW)
+            except Exception as e:
+                # Keep the old watermark so the next attempt re-reads these rows
+                ok = False
+                print(f"Error syncing {key}: {e}")
+        if ok:
+            self.since = started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.refresh()
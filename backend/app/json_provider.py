@@ -0,0 +1,49 @@
+from datetime import date, datetime
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder below
+    orjson = None
+
+
+def _default(obj):
+    """Encode the BSON types routes hand to jsonify: ObjectId as hex, datetimes as ISO 8601."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # Decimal, UUID, dataclasses and __html__ as Flask's own provider encodes them
+    return DefaultJSONProvider.default(obj)
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider that serializes Mongo documents as they come out of pymongo.
+
+    Uses orjson when it is installed (datetimes are encoded natively, ObjectIds
+    through _default) and the stdlib encoder otherwise, with the same output.
+    Keys are not sorted and non-ASCII text is not escaped.
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+        kwargs.setdefault("default", _default)
+        kwargs.setdefault("separators", (",", ":"))
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps(obj) + "\n", mimetype=self.mimetype)
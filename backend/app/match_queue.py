@@ -0,0 +1,276 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from routes.gemini.langchain_match import get_or_create_match_analysis, match_cache_key, pair_score_ops, store_pair_score, write_score_ops
+from app.match_ranker import rank_candidates, record_ranking_stats
+from app.profile_cache import get_user_profiles
+
+# Set whenever new jobs are enqueued so idle workers in this process wake up early
+_wake_event = threading.Event()
+
+
+def _pair(user_id, other_user_id):
+    # Compatibility is symmetric, so (a, b) and (b, a) are the same job
+    a, b = ObjectId(user_id), ObjectId(other_user_id)
+    return (a, b) if str(a) < str(b) else (b, a)
+
+
+def _pending_job_op(user_id, other_user_id, event_id, now):
+    low, high = _pair(user_id, other_user_id)
+    return UpdateOne(
+        {"user_id": low, "matched_user_id": high, "status": "pending"},
+        {
+            "$addToSet": {"event_ids": ObjectId(event_id)},
+            "$setOnInsert": {"attempts": 0, "created_at": now}
+        },
+        upsert=True
+    )
+
+
+def _write_jobs(db, ops):
+    if not ops:
+        return 0
+    try:
+        db.match_jobs.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # Another writer created the same pending pair first; the unique index already dedups it
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+    _wake_event.set()
+    return len(ops)
+
+
+def enqueue_match_job(db, user_id, other_user_id, event_id):
+    """Queue a match computation for a pair of users who share an event."""
+    if str(user_id) == str(other_user_id):
+        return 0
+    return _write_jobs(db, [_pending_job_op(user_id, other_user_id, event_id, datetime.utcnow())])
+
+
+def existing_llm_scores(db, user, candidates):
+    """
+    LLM scores already known for (user, candidate) pairs, keyed by candidate id.
+
+    A cached analysis at the pair's current profile versions wins; otherwise the
+    latest non-local score in the user's match docs is used.
+    """
+    keys = {match_cache_key(user, c): c["_id"] for c in candidates}
+    scores = {}
+    for doc in db.match_cache.find({"_id": {"$in": list(keys)}}, {"analysis.overall_match_score": 1}):
+        scores[keys[doc["_id"]]] = doc["analysis"]["overall_match_score"]
+
+    remaining = {ObjectId(c["_id"]) for c in candidates if c["_id"] not in scores}
+    if remaining:
+        docs = db.matches.find(
+            {"user_id": ObjectId(user["_id"]), "matches.matched_user_id": {"$in": list(remaining)}},
+            {"matches": 1}
+        ).sort("created_at", -1)
+        for doc in docs:
+            for m in doc.get("matches", []):
+                cid = str(m["matched_user_id"])
+                if m["matched_user_id"] in remaining and cid not in scores and m.get("source") != "local":
+                    scores[cid] = m["score"]
+    return scores
+
+
+def enqueue_matches_for_user(db, user_id, event_ids, top_k=None, min_score=None):
+    """
+    Queue one ranking job for user_id's co-attendees on the given events.
+
+    Repeated calls before a worker picks it up merge into the same pending job,
+    so a request only pays for a single upsert.
+    """
+    if not event_ids:
+        return 0
+    fields = {"kind": "rank"}
+    if top_k is not None:
+        fields["top_k"] = top_k
+    if min_score is not None:
+        fields["min_score"] = min_score
+    # matched_user_id None keeps rank jobs inside the one-pending-job-per-pair index
+    op = UpdateOne(
+        {"user_id": ObjectId(user_id), "matched_user_id": None, "status": "pending"},
+        {
+            "$addToSet": {"event_ids": {"$each": [ObjectId(eid) for eid in event_ids]}},
+            "$set": fields,
+            "$setOnInsert": {"attempts": 0, "created_at": datetime.utcnow()}
+        },
+        upsert=True
+    )
+    return _write_jobs(db, [op])
+
+
+def rank_matches_for_user(db, user_id, event_ids, top_k=None, min_score=None):
+    """
+    Stage 1, run by the match worker: rank user_id's co-attendees on the given
+    events and queue LLM jobs for the best ones.
+
+    Every candidate gets a cheap local score; only the top_k above min_score are queued
+    for a full analysis. The rest keep an LLM score if the pair already has one and
+    are stored with their local score otherwise, in two bulk writes.
+    """
+    user_oid = ObjectId(user_id)
+    now = datetime.utcnow()
+
+    # candidate id -> events shared with user_id
+    shared = {}
+    attendance = db.event_attendance.find(
+        {"event_id": {"$in": [ObjectId(eid) for eid in event_ids]}, "user_id": {"$ne": user_oid}},
+        {"event_id": 1, "user_id": 1}
+    )
+    for row in attendance:
+        shared.setdefault(str(row["user_id"]), []).append(row["event_id"])
+
+    stats = {"candidates": len(shared), "llm_queued": 0, "local_only": 0}
+    if not shared:
+        return stats
+
+    users = get_user_profiles(db, [user_oid] + list(shared))
+    user = users.get(str(user_oid))
+    if not user:
+        return stats
+
+    candidates = [users[cid] for cid in shared if cid in users]
+    selected, rejected = rank_candidates(user, candidates, top_k, min_score)
+
+    # Never replace an earlier LLM analysis of a pair with its local score
+    llm_scores = existing_llm_scores(db, user, [candidate for candidate, _ in rejected])
+    match_ops, top_ops = [], []
+    for candidate, score in rejected:
+        if candidate["_id"] in llm_scores:
+            ops = pair_score_ops(user_oid, candidate["_id"], shared[candidate["_id"]], llm_scores[candidate["_id"]])
+        else:
+            ops = pair_score_ops(user_oid, candidate["_id"], shared[candidate["_id"]], score, source="local")
+        match_ops += ops[0]
+        top_ops += ops[1]
+    write_score_ops(db, match_ops, top_ops)
+
+    ops = [
+        _pending_job_op(user_oid, candidate["_id"], event_id, now)
+        for candidate, _ in selected
+        for event_id in shared[candidate["_id"]]
+    ]
+    _write_jobs(db, ops)
+
+    stats["llm_queued"] = len(selected)
+    stats["local_only"] = len(rejected)
+    return stats
+
+
+def get_match_job_stats(db):
+    counts = db.match_jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+    return {c["_id"]: c["count"] for c in counts}
+
+
+class MatchWorker:
+    """Drains the match_jobs collection with a bounded thread pool."""
+
+    def __init__(self, db, max_workers=4, poll_interval=2.0, lease_seconds=300, max_attempts=3):
+        self.db = db
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._stop = threading.Event()
+        self._executor = None
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="match-worker")
+        self._thread = threading.Thread(target=self._run, name="match-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        self._stop.set()
+        _wake_event.set()
+        if self._thread:
+            self._thread.join()
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+
+    def _run(self):
+        last_recovery = 0
+        while not self._stop.is_set():
+            if time.monotonic() - last_recovery > self.lease_seconds:
+                self._recover_stale_jobs()
+                last_recovery = time.monotonic()
+
+            # Only claim a job once there is a free slot to run it
+            self._slots.acquire()
+            try:
+                job = self._claim_job()
+            except Exception as e:
+                print(f"Error claiming match job: {e}")
+                job = None
+            if job is None:
+                self._slots.release()
+                _wake_event.wait(self.poll_interval)
+                _wake_event.clear()
+                continue
+            self._executor.submit(self._process, job)
+
+    def _claim_job(self):
+        return self.db.match_jobs.find_one_and_update(
+            {"status": "pending"},
+            {"$set": {"status": "running", "claimed_at": datetime.utcnow()}, "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _recover_stale_jobs(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        for job in self.db.match_jobs.find({"status": "running", "claimed_at": {"$lt": cutoff}}, {"_id": 1}):
+            try:
+                self.db.match_jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "pending"}})
+            except DuplicateKeyError:
+                # A fresh pending job for the same pair already exists
+                self.db.match_jobs.delete_one({"_id": job["_id"]})
+
+    def _process(self, job):
+        try:
+            self.run_job(job)
+            self.db.match_jobs.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"status": "done", "finished_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            print(f"Match job {job['_id']} failed: {e}")
+            status = "failed" if job.get("attempts", 0) >= self.max_attempts else "pending"
+            try:
+                self.db.match_jobs.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {"status": status, "error": str(e), "finished_at": datetime.utcnow()}}
+                )
+            except DuplicateKeyError:
+                self.db.match_jobs.delete_one({"_id": job["_id"]})
+        finally:
+            self._slots.release()
+
+    def run_job(self, job):
+        if job.get("kind") == "rank":
+            return rank_matches_for_user(
+                self.db, job["user_id"], job.get("event_ids", []),
+                top_k=job.get("top_k"), min_score=job.get("min_score")
+            )
+
+        # Fresh from Mongo: profile_version keys the match cache, and another worker may have just bumped it
+        users = get_user_profiles(self.db, [job["user_id"], job["matched_user_id"]], use_cache=False)
+        user1 = users.get(str(job["user_id"]))
+        user2 = users.get(str(job["matched_user_id"]))
+        event_ids = job.get("event_ids", [])
+        if not user1 or not user2 or not event_ids:
+            return None
+
+        # Stage 2: full analysis for a candidate that survived local ranking
+        match_analysis = get_or_create_match_analysis(self.db, user1, user2)
+        record_ranking_stats(llm_scored=1)
+        store_pair_score(self.db, user1["_id"], user2["_id"], event_ids, match_analysis.overall_match_score)
+        return match_analysis
@@ -0,0 +1,47 @@
+import os
+import threading
+from collections import Counter
+from routes.gemini.langchain_match import fallback_match_analysis, to_match_profile
+
+# Only the best MATCH_LLM_TOP_K candidates scoring at least MATCH_LLM_MIN_SCORE locally go to the LLM
+MATCH_LLM_TOP_K = int(os.getenv("MATCH_LLM_TOP_K", "10"))
+MATCH_LLM_MIN_SCORE = int(os.getenv("MATCH_LLM_MIN_SCORE", "40"))
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def rank_candidates(user, candidates, top_k=None, min_score=None):
+    """
+    Stage 1 of match ranking: score every candidate locally, then split them.
+
+    Returns (selected, rejected) where each is a list of (candidate, local_score).
+    Selected candidates are the top_k at or above min_score and should get a full
+    LLM analysis; rejected ones keep their local score.
+    """
+    top_k = MATCH_LLM_TOP_K if top_k is None else top_k
+    min_score = MATCH_LLM_MIN_SCORE if min_score is None else min_score
+
+    profile = to_match_profile(user)
+    scored = [
+        (candidate, fallback_match_analysis(profile, to_match_profile(candidate)).overall_match_score)
+        for candidate in candidates
+    ]
+    scored.sort(key=lambda pair: pair[1], reverse=True)
+
+    selected = [pair for pair in scored if pair[1] >= min_score][:top_k]
+    selected_ids = {id(candidate) for candidate, _ in selected}
+    rejected = [pair for pair in scored if id(pair[0]) not in selected_ids]
+
+    record_ranking_stats(local_scored=len(scored), llm_queued=len(selected), local_only=len(rejected))
+    return selected, rejected
+
+
+def record_ranking_stats(**counts):
+    with _stats_lock:
+        _stats.update(counts)
+
+
+def get_ranking_stats():
+    with _stats_lock:
+        return dict(_stats)
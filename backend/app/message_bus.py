@@ -0,0 +1,141 @@
+import queue
+import threading
+import time
+from collections import defaultdict
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+
+class MessageBus:
+    """
+    In-process pub/sub of chat events keyed by user id.
+
+    Each open stream holds a small queue; delivering to a user with no open
+    streams is a dict miss. At most max_streams streams are open per process
+    (None = unbounded). Cross-worker delivery is delegated to a fan-out
+    backend that calls deliver() in every process.
+    """
+
+    def __init__(self, fanout=None, queue_size=100, max_streams=None):
+        self.queue_size = queue_size
+        self.max_streams = max_streams
+        self._subscribers = defaultdict(set)
+        self._streams = 0
+        self._lock = threading.Lock()
+        self.fanout = fanout or LocalFanout()
+
+    def subscribe(self, user_id):
+        """A new stream queue for user_id, or None if this process is at max_streams."""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if self.max_streams is not None and self._streams >= self.max_streams:
+                return None
+            self._subscribers[str(user_id)].add(q)
+            self._streams += 1
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            subscribers = self._subscribers.get(str(user_id))
+            if subscribers is not None and q in subscribers:
+                subscribers.discard(q)
+                self._streams -= 1
+                if not subscribers:
+                    del self._subscribers[str(user_id)]
+
+    def publish(self, user_ids, event):
+        """Send event to every stream of the given users, in whichever worker they are."""
+        self.fanout.publish(self, [str(uid) for uid in user_ids], event)
+
+    def deliver(self, user_ids, event):
+        """Hand an event to this process's streams; called by the fan-out backend."""
+        with self._lock:
+            targets = [q for uid in user_ids for q in self._subscribers.get(uid, ())]
+        for q in targets:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # A stalled client drops events rather than holding up the sender
+                pass
+
+    def start(self):
+        self.fanout.start(self)
+
+    def stop(self):
+        self.fanout.stop()
+
+
+class LocalFanout:
+    """Single-process fan-out: publishing is delivering."""
+
+    def publish(self, bus, user_ids, event):
+        bus.deliver(user_ids, event)
+
+    def start(self, bus):
+        pass
+
+    def stop(self):
+        pass
+
+
+class MongoCappedFanout:
+    """
+    Cross-worker fan-out through a capped collection.
+
+    Publishing inserts one document; every worker tails the collection with a
+    tailable await cursor and delivers what it reads to its own streams.
+    """
+
+    def __init__(self, db, collection="message_events", size_bytes=16 * 1024 * 1024, retry_interval=1.0):
+        self.db = db
+        self.collection_name = collection
+        self.size_bytes = size_bytes
+        self.retry_interval = retry_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    def ensure_collection(self):
+        try:
+            self.db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass  # already exists
+        # A tailable cursor on an empty capped collection dies at once, so seed it
+        if self.collection.find_one({}, {"_id": 1}) is None:
+            self.collection.insert_one({"user_ids": [], "event": None})
+
+    def publish(self, bus, user_ids, event):
+        self.collection.insert_one({"user_ids": user_ids, "event": event})
+
+    def start(self, bus):
+        if self._thread and self._thread.is_alive():
+            return
+        self.ensure_collection()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._tail, args=(bus,), name="message-fanout", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _tail(self, bus):
+        # Only deliver what is published after this worker started
+        last = self.collection.find_one(sort=[("$natural", -1)], projection={"_id": 1})
+        last_id = last["_id"] if last else None
+        while not self._stop.is_set():
+            query = {"_id": {"$gt": last_id}} if last_id else {}
+            try:
+                cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT, max_await_time_ms=1000)
+                while cursor.alive and not self._stop.is_set():
+                    for doc in cursor:
+                        last_id = doc["_id"]
+                        bus.deliver(doc["user_ids"], doc["event"])
+            except PyMongoError as e:
+                print(f"Error tailing {self.collection_name}: {e}")
+            # Cursors only die on errors; reopen after the last document seen
+            time.sleep(self.retry_interval)
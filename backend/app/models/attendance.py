@@ -0,0 +1,15 @@
+from datetime import datetime
+from bson import ObjectId
+
+class Attendance:
+    def __init__(self, event_id, user_id, joined_at=None):
+        self.event_id = ObjectId(event_id)
+        self.user_id = ObjectId(user_id)
+        self.joined_at = joined_at or datetime.utcnow()
+
+    def to_dict(self):
+        return {
+            "event_id": self.event_id,
+            "user_id": self.user_id,
+            "joined_at": self.joined_at
+        }
@@ -1,4 +1,5 @@
 from datetime import datetime
+from bson import ObjectId
 
 class Event:
     def __init__(self, name, location, time, price=None, desc="", users=None):
@@ -8,7 +9,7 @@ class Event:
         # self.price = price
         # self.link = link
         self.desc = desc
-        self.users = users or []
+        self.users = [ObjectId(uid) for uid in (users or [])]  # initial attendees, stored in event_attendance
 
     def to_dict(self):
         return {
@@ -18,5 +19,5 @@ class Event:
             # "price": self.price,
             # "link": self.link,
             "desc": self.desc,
-            "users": self.users
+            "attendee_count": 0
         }
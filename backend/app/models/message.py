@@ -1,10 +1,16 @@
 from datetime import datetime
 from bson import ObjectId
 
+def conversation_id(user_id, other_user_id):
+    """Canonical id for a two-person chat: the sorted pair of user ids."""
+    low, high = sorted((str(user_id), str(other_user_id)))
+    return f"{low}:{high}"
+
 class Message:
     def __init__(self, from_user_id, to_user_id, text, created_at=None):
         self.from_user_id = str(from_user_id)
         self.to_user_id = str(to_user_id)
+        self.conversation_id = conversation_id(from_user_id, to_user_id)
         self.text = text
         self.created_at = created_at or datetime.utcnow()
 
@@ -12,6 +18,7 @@ class Message:
         return {
             "from_user_id": self.from_user_id,
             "to_user_id": self.to_user_id,
+            "conversation_id": self.conversation_id,
             "text": self.text,
             "created_at": self.created_at,
-        } 
\ No newline at end of file
+        }
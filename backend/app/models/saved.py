@@ -1,12 +1,15 @@
+from datetime import datetime
 from bson import ObjectId
 
 class Saved:
-    def __init__(self, user_id, saved_user_id):
+    def __init__(self, user_id, saved_user_id, created_at=None):
         self.user_id = ObjectId(user_id)
         self.saved_user_id = ObjectId(saved_user_id)
+        self.created_at = created_at or datetime.utcnow()
 
     def to_dict(self):
         return {
             "user_id": self.user_id,
-            "saved_user_id": self.saved_user_id
+            "saved_user_id": self.saved_user_id,
+            "created_at": self.created_at
         }
@@ -19,5 +19,6 @@ class User:
             'interests': self.interests,
             'profile_pic': self.profile_pic,
             'dietary_restrictions': self.dietary_restrictions,
-            'location': self.location
+            'location': self.location,
+            'travel_dates': self.travel_dates
         }
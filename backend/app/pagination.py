@@ -0,0 +1,38 @@
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+
+
+def encode_cursor(sort_value, last_id):
+    """Opaque keyset cursor for the last row of a page sorted by (sort_value, _id)."""
+    if isinstance(sort_value, datetime):
+        payload = {"d": sort_value.isoformat(), "id": str(last_id)}
+    else:
+        payload = {"v": sort_value, "id": str(last_id)}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = datetime.fromisoformat(payload["d"]) if "d" in payload else payload.get("v")
+        return value, ObjectId(payload["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def keyset_filter(field, value, last_id, descending=False):
+    """Match rows strictly after (value, last_id) in (field, _id) order."""
+    op = "$lt" if descending else "$gt"
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, "_id": {op: last_id}}
+    ]}
+
+
+def clamp_limit(limit, default=50, maximum=200):
+    if not limit or limit < 1:
+        return default
+    return min(limit, maximum)
@@ -0,0 +1,177 @@
+import copy
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from blinker import signal
+from bson import ObjectId
+
+# Sent with user_id and/or email whenever a profile is created or changed
+profile_changed = signal("profile-changed")
+
+
+def serialize_profile(user):
+    """Plain-dict profile: string _id, YYYY-MM-DD birthday and defaults for optional fields."""
+    profile = dict(user)
+    profile["_id"] = str(profile["_id"])
+    profile["interests"] = profile.get("interests", [])
+    profile["gender"] = profile.get("gender")
+    profile["profile_pic"] = profile.get("profile_pic")
+    profile["dietary_restrictions"] = profile.get("dietary_restrictions", [])
+    if isinstance(profile.get("birthday"), datetime):
+        profile["birthday"] = profile["birthday"].strftime("%Y-%m-%d")
+    return profile
+
+
+class ProfileCache:
+    """
+    Process-local LRU of user profiles with a TTL, addressable by _id or email.
+
+    Local writes invalidate entries through the profile_changed signal, and a
+    ProfileInvalidator carries them to the other workers; the TTL bounds how
+    long a missed invalidation can go unnoticed.
+    """
+
+    def __init__(self, maxsize=2048, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        profile_changed.connect(self._on_profile_changed, weak=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, profile = entry
+            if expires_at < time.monotonic():
+                self._drop_locked(profile)
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(profile)
+
+    def put(self, profile):
+        profile = copy.deepcopy(profile)
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key in self._keys(profile):
+                self._entries[key] = (expires_at, profile)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._drop_locked(evicted)
+
+    def invalidate(self, user_id=None, email=None):
+        with self._lock:
+            for key in (("id", str(user_id)), ("email", email)):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._drop_locked(entry[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _keys(profile):
+        keys = [("id", str(profile["_id"]))]
+        if profile.get("email"):
+            keys.append(("email", profile["email"]))
+        return keys
+
+    def _drop_locked(self, profile):
+        for key in self._keys(profile):
+            self._entries.pop(key, None)
+
+    def _on_profile_changed(self, sender, user_id=None, email=None, **kwargs):
+        self.invalidate(user_id=user_id, email=email)
+
+
+profile_cache = ProfileCache(
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("PROFILE_CACHE_TTL", "60"))
+)
+
+
+class ProfileInvalidator:
+    """
+    Carries profile_changed to every serving process.
+
+    Each local send is published through a fan-out backend (the MongoCappedFanout
+    used by the message bus, on its own collection); every other process drops
+    the user's cache entry when the event reaches it.
+    """
+
+    def __init__(self, fanout, cache=None):
+        self.fanout = fanout
+        self.cache = cache or profile_cache
+        # Identifies this process's own events, which its signal already handled
+        self.origin = uuid.uuid4().hex
+
+    def start(self):
+        profile_changed.connect(self._publish, weak=False)
+        self.fanout.start(self)
+
+    def stop(self):
+        profile_changed.disconnect(self._publish)
+        self.fanout.stop()
+
+    def _publish(self, sender, user_id=None, email=None, **kwargs):
+        try:
+            self.fanout.publish(self, [], {"origin": self.origin, "user_id": user_id, "email": email})
+        except Exception as e:
+            # Other workers fall back to the TTL for this change
+            print(f"Error publishing profile invalidation: {e}")
+
+    def deliver(self, user_ids, event):
+        """Called by the fan-out backend for every published event."""
+        if event and event.get("origin") != self.origin:
+            self.cache.invalidate(user_id=event.get("user_id"), email=event.get("email"))
+
+
+def get_cached_profile(user_id=None, email=None):
+    """Cached profile or None, without touching the database."""
+    return profile_cache.get(("id", str(user_id)) if user_id is not None else ("email", email))
+
+
+def get_user_profile(db, user_id=None, email=None):
+    """Read-through profile lookup by _id or email; returns a plain dict or None."""
+    key = ("id", str(user_id)) if user_id is not None else ("email", email)
+    profile = profile_cache.get(key)
+    if profile is not None:
+        return profile
+
+    query = {"_id": ObjectId(user_id)} if user_id is not None else {"email": email}
+    user = db.users.find_one(query)
+    if not user:
+        return None
+    profile = serialize_profile(user)
+    profile_cache.put(profile)
+    return profile
+
+
+def get_user_profiles(db, user_ids, use_cache=True):
+    """
+    Profiles for many ids: cache hits first, then one $in query for the misses.
+
+    use_cache=False reads every profile from Mongo (and refreshes the cache),
+    for callers whose results are keyed by profile_version.
+    """
+    profiles = {}
+    missing = []
+    for user_id in user_ids:
+        profile = profile_cache.get(("id", str(user_id))) if use_cache else None
+        if profile is not None:
+            profiles[str(user_id)] = profile
+        else:
+            missing.append(ObjectId(user_id))
+
+    if missing:
+        for user in db.users.find({"_id": {"$in": missing}}):
+            profile = serialize_profile(user)
+            profile_cache.put(profile)
+            profiles[profile["_id"]] = profile
+    return profiles
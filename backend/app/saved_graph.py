@@ -0,0 +1,67 @@
+import threading
+from collections import defaultdict
+
+
+class SavedGraph:
+    """
+    Directed who-saved-whom graph over the saved collection.
+
+    Both directions are kept as adjacency sets, so mutual saves are one set
+    intersection and 2-hop recommendations only walk the neighbours of the
+    user's own saves.
+    """
+
+    def __init__(self):
+        self._saves = defaultdict(set)     # user -> users they saved
+        self._saved_by = defaultdict(set)  # user -> users who saved them
+        self._lock = threading.RLock()
+
+    def build(self, db):
+        """Load every saved edge from Mongo; done once in the process that loads the app."""
+        with self._lock:
+            self._saves.clear()
+            self._saved_by.clear()
+            for row in db.saved.find({}, {"user_id": 1, "saved_user_id": 1, "_id": 0}):
+                self.add(row["user_id"], row["saved_user_id"])
+        return self
+
+    def sync(self, db, since):
+        """Add edges saved at or after since. Saves are never deleted, so this only adds."""
+        for row in db.saved.find({"created_at": {"$gte": since}}, {"user_id": 1, "saved_user_id": 1, "_id": 0}):
+            self.add(row["user_id"], row["saved_user_id"])
+        return self
+
+    def add(self, user_id, saved_user_id):
+        user_id, saved_user_id = str(user_id), str(saved_user_id)
+        with self._lock:
+            self._saves[user_id].add(saved_user_id)
+            self._saved_by[saved_user_id].add(user_id)
+
+    def mutual(self, user_id):
+        """Users that user_id saved and who saved user_id back."""
+        user_id = str(user_id)
+        with self._lock:
+            saves = self._saves.get(user_id, set())
+            saved_by = self._saved_by.get(user_id, set())
+            smaller, larger = sorted((saves, saved_by), key=len)
+            return sorted(v for v in smaller if v in larger)
+
+    def recommendations(self, user_id, limit=20):
+        """
+        Users saved by the people user_id saved, excluding user_id and anyone
+        they already saved, ranked by the number of such 2-hop paths.
+        """
+        user_id = str(user_id)
+        with self._lock:
+            saves = self._saves.get(user_id, set())
+            paths = defaultdict(int)
+            for v in saves:
+                for w in self._saves.get(v, ()):
+                    if w != user_id and w not in saves:
+                        paths[w] += 1
+
+        ranked = sorted(paths.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [{"user_id": w, "paths": count} for w, count in ranked]
+
+    def __len__(self):
+        return sum(len(targets) for targets in self._saves.values())
@@ -0,0 +1,116 @@
+import hashlib
+import random
+import threading
+from collections import defaultdict
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class MinHashLSHIndex:
+    """
+    Approximate Jaccard nearest neighbours over users' interest sets.
+
+    Each user is reduced to a MinHash signature of num_perm values, split into
+    bands of rows. Users sharing any band land in the same bucket, so a query only
+    compares against bucket-mates instead of the whole user base.
+    """
+
+    def __init__(self, num_perm=64, bands=16, include_destination=False, seed=42):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.include_destination = include_destination
+
+        rng = random.Random(seed)
+        self._perms = [(rng.randint(1, _PRIME - 1), rng.randint(0, _PRIME - 1)) for _ in range(num_perm)]
+        self._signatures = {}
+        self._buckets = [defaultdict(set) for _ in range(bands)]
+        self._lock = threading.RLock()
+
+    def tokens_for(self, user):
+        tokens = {f"i:{interest.strip().lower()}" for interest in user.get("interests") or [] if interest}
+        location = (user.get("location") or "").strip().lower()
+        if self.include_destination and location:
+            tokens.add(f"d:{location}")
+        return tokens
+
+    def signature(self, tokens):
+        hashes = [_token_hash(t) for t in tokens]
+        return tuple(
+            min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, signature[start:start + self.rows]
+
+    def update(self, user):
+        """Add or re-index a user document (needs _id, interests and optionally location)."""
+        user_id = str(user["_id"])
+        tokens = self.tokens_for(user)
+        signature = self.signature(tokens) if tokens else None
+
+        with self._lock:
+            self._remove_locked(user_id)
+            if signature is None:
+                return
+            self._signatures[user_id] = signature
+            for band, key in self._band_keys(signature):
+                self._buckets[band][key].add(user_id)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._remove_locked(str(user_id))
+
+    def _remove_locked(self, user_id):
+        signature = self._signatures.pop(user_id, None)
+        if signature is None:
+            return
+        for band, key in self._band_keys(signature):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(user_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def query(self, user_id, k=10):
+        """Return up to k (user_id, estimated_jaccard) pairs most similar to user_id."""
+        user_id = str(user_id)
+        with self._lock:
+            signature = self._signatures.get(user_id)
+            if signature is None:
+                return []
+            candidates = set()
+            for band, key in self._band_keys(signature):
+                candidates |= self._buckets[band].get(key, set())
+            candidates.discard(user_id)
+            scored = [
+                (other, sum(x == y for x, y in zip(signature, self._signatures[other])) / self.num_perm)
+                for other in candidates
+            ]
+        scored.sort(key=lambda pair: pair[1], reverse=True)
+        return scored[:k]
+
+    def build(self, db):
+        """Index every user from Mongo; done once in the process that loads the app."""
+        for user in db.users.find({}, {"interests": 1, "location": 1}):
+            self.update(user)
+        return self
+
+    def sync(self, db, since):
+        """Re-index users created or edited at or after since."""
+        for user in db.users.find({"updated_at": {"$gte": since}}, {"interests": 1, "location": 1}):
+            self.update(user)
+        return self
+
+    def __len__(self):
+        return len(self._signatures)
@@ -0,0 +1,51 @@
+import os
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+
+# How many matches we keep per user; reads can ask for any k up to this
+TOP_MATCHES_SIZE = int(os.getenv("TOP_MATCHES_SIZE", "50"))
+
+
+def top_matches_ops(user_id, matched_user_id, score, event_id=None, source="llm"):
+    """Ordered $pull/$push that insert or rescore matched_user_id in user_id's top list."""
+    user_oid = ObjectId(user_id)
+    matched_oid = ObjectId(matched_user_id)
+    entry = {
+        "matched_user_id": matched_oid,
+        "score": float(score),
+        "event_id": ObjectId(event_id) if event_id else None,
+        "source": source,
+        "updated_at": datetime.utcnow()
+    }
+
+    return [
+        # Drop the old score for this pair first so a rescore can move it down as well as up
+        UpdateOne({"user_id": user_oid}, {"$pull": {"matches": {"matched_user_id": matched_oid}}}),
+        # $sort + $slice keep the array a bounded, score-ordered heap on the server
+        UpdateOne(
+            {"user_id": user_oid},
+            {
+                "$push": {"matches": {"$each": [entry], "$sort": {"score": -1}, "$slice": TOP_MATCHES_SIZE}},
+                "$set": {"updated_at": entry["updated_at"]}
+            },
+            upsert=True
+        )
+    ]
+
+
+def get_top_matches(db, user_id, k=10):
+    """Return the user's k best matches, already sorted by score."""
+    k = max(1, min(int(k), TOP_MATCHES_SIZE))
+    doc = db.top_matches.find_one({"user_id": ObjectId(user_id)}, {"matches": {"$slice": k}})
+    if not doc:
+        return []
+
+    results = []
+    for m in doc.get("matches", []):
+        results.append({
+            "matched_user_id": str(m["matched_user_id"]),
+            "score": m["score"],
+            "event_id": str(m["event_id"]) if m.get("event_id") else None
+        })
+    return results
@@ -0,0 +1,62 @@
+# Production serving: gunicorn -c gunicorn.conf.py  (run from backend/)
+#
+# The app, its indexes and in-memory caches are loaded once in the master
+# (preload_app) and shared copy-on-write with the workers. Nothing that owns a
+# socket or a thread survives the fork: each worker opens its own MongoClient
+# and starts its own match worker, message bus and index refresher in post_fork.
+# Workers share nothing in memory, so with more than one worker message streams
+# and profile-cache invalidation go through Mongo (MESSAGE_FANOUT=mongo).
+import multiprocessing
+import os
+
+wsgi_app = "src.app:app"
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+# Threads let one worker overlap Mongo and Gemini round-trips; each open
+# /messages/stream holds one thread for as long as the client stays connected
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+preload_app = True
+
+# Pending connections the kernel queues before accept()
+backlog = int(os.getenv("GUNICORN_BACKLOG", "2048"))
+# Seconds an idle keep-alive connection is held open
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Itinerary generation waits on Gemini, so allow slow requests
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# On SIGTERM, workers get this long to finish in-flight requests and match jobs
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# Optionally recycle workers after N requests to bound in-process cache growth (0 = never)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+
+
+def on_starting(server):
+    # Read by start_background_services in each worker; cfg includes command-line overrides
+    os.environ.setdefault("MESSAGE_FANOUT", "mongo" if server.cfg.workers > 1 else "local")
+    if server.cfg.workers > 1 and os.environ["MESSAGE_FANOUT"] != "mongo":
+        raise RuntimeError("MESSAGE_FANOUT=local only reaches streams on the same worker; use MESSAGE_FANOUT=mongo with several workers")
+    # Streams may take at most half of a worker's threads; the rest always serve requests
+    os.environ.setdefault("MESSAGE_STREAMS_PER_WORKER", str(max(1, server.cfg.threads // 2)))
+
+
+def when_ready(server):
+    # The master only needed Mongo to preload; workers open their own clients
+    from src.app import app
+    app.config["MONGO_CLIENT"].close()
+
+
+def post_fork(server, worker):
+    from src.app import app, init_worker
+    init_worker(app)
+
+
+def worker_exit(server, worker):
+    from src.app import app, stop_background_services
+    stop_background_services(app)
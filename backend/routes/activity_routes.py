@@ -4,8 +4,12 @@ from flask import Blueprint, request, jsonify, current_app
 from dotenv import load_dotenv
 from datetime import datetime
 from .gemini.parsing_activities import parse_activities_smart
-from .gemini.gemini import generate_itinerary_json
-from routes.db.user_routes import getUserByEmail
+from bson import ObjectId
+from .gemini.gemini import generate_itinerary_json, regenerate_itinerary_items, saveItineraryEvents
+from .db.event_routes import removeAttendance
+from app.event_identity import normalize_name
+from app.match_queue import enqueue_matches_for_user
+from app.profile_cache import get_user_profile
 
 load_dotenv()
 
@@ -16,6 +20,137 @@ EVENTBRITE_TOKEN = os.getenv("EVENTBRITE_TOKEN")
 
 TICKETMASTER_API_KEY = os.getenv("TICKETMASTER_API_KEY")
 
+# Provider responses are cached in Mongo so itinerary edits don't refetch them
+PROVIDER_CACHE_TTL = int(os.getenv("PROVIDER_CACHE_TTL", str(6 * 3600)))
+
+# Ticketmaster segment ids for the categories parse_activities_smart returns
+TICKETMASTER_SEGMENT_IDS = {
+    "music": "KZFzniwnSyZfZ7v7nJ",
+    "sports": "KZFzniwnSyZfZ7v7nE",
+    "arts": "KZFzniwnSyZfZ7v7na",
+    "film": "KZFzniwnSyZfZ7v7nn",
+    "misc": "KZFzniwnSyZfZ7v7n1"
+}
+
+DEFAULT_GOOGLE_CATEGORIES = ["restaurant", "tourist_attraction"]
+DEFAULT_TICKETMASTER_CATEGORIES = ["music"]
+
+class TicketmasterError(Exception):
+    pass
+
+class PlacesError(Exception):
+    pass
+
+# Places statuses whose results are a real answer; anything else (quota, denied, bad request) is not cached
+PLACES_CACHEABLE_STATUSES = ("OK", "ZERO_RESULTS")
+
+def cachedProviderCall(db, key, fetch):
+    """
+    Return fetch() through the provider_cache collection, keyed by key.
+
+    fetch() raises on provider errors, so only real answers are stored.
+    """
+    cached = db.provider_cache.find_one({"_id": key})
+    if cached and (datetime.utcnow() - cached["created_at"]).total_seconds() < PROVIDER_CACHE_TTL:
+        return cached["results"]
+    results = fetch()
+    db.provider_cache.replace_one(
+        {"_id": key},
+        {"results": results, "created_at": datetime.utcnow()},
+        upsert=True
+    )
+    return results
+
+def fetchGooglePlaces(db, city, category):
+    def fetch():
+        url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+        params = {
+            "query": f"{category} in {city}",
+            "key": GOOGLE_API_KEY
+        }
+        res = requests.get(url, params=params).json()
+        if res.get("status") not in PLACES_CACHEABLE_STATUSES:
+            raise PlacesError(f"{res.get('status')}: {res.get('error_message', '')}")
+        return [
+            {
+                "name": place.get("name"),
+                "tags": [category],
+                "location": city,
+                "address": place.get("formatted_address")
+            }
+            for place in res.get("results", [])
+        ]
+
+    try:
+        return cachedProviderCall(db, f"places:{city.strip().lower()}:{category}", fetch)
+    except Exception as e:
+        print(f"Error fetching Google Places data for {category}: {e}")
+        return []
+
+def fetchTicketmasterEvents(db, city, start_date, end_date, categories):
+    def fetch():
+        start_datetime = start_date.isoformat() + "Z"
+        end_datetime = end_date.isoformat() + "Z"
+
+        # Build category (classification) filter for Ticketmaster
+        classification_filter = ','.join([TICKETMASTER_SEGMENT_IDS[cat.lower()] for cat in categories if cat.lower() in TICKETMASTER_SEGMENT_IDS])
+
+        params = {
+            "apikey": TICKETMASTER_API_KEY,
+            "city": city,
+            "startDateTime": start_datetime,
+            "endDateTime": end_datetime,
+            "size": 20,
+            "sort": "date,asc"
+        }
+
+        if classification_filter:
+            params["segmentId"] = classification_filter
+
+        response = requests.get("https://app.ticketmaster.com/discovery/v2/events.json", params=params)
+
+        if response.status_code != 200:
+            raise TicketmasterError(response.text)
+        payload = response.json()
+        if "fault" in payload or "errors" in payload:
+            raise TicketmasterError(str(payload.get("fault") or payload.get("errors")))
+
+        events = payload.get("_embedded", {}).get("events", [])
+        results = []
+        for e in events:
+            # Handle price
+            price_info = e.get("priceRanges", [])
+            if price_info and isinstance(price_info, list):
+                price = {
+                    "min": price_info[0].get("min"),
+                    "max": price_info[0].get("max"),
+                    "currency": price_info[0].get("currency")
+                }
+            else:
+                price = {}
+
+            results.append({
+                "name": e.get("name"),
+                # "url": e.get("url"),
+                "start_date": e.get("dates", {}).get("start", {}).get("localDate"),
+                "start_time": e.get("dates", {}).get("start", {}).get("localTime"),
+                "address": e.get("_embedded", {}).get("venues", [{}])[0].get("name"),
+                "location": e.get("_embedded", {}).get("venues", [{}])[0].get("city", {}).get("name"),
+                 "price": price
+            })
+        return results
+
+    key = f"ticketmaster:{city.strip().lower()}:{start_date:%Y-%m-%d}:{end_date:%Y-%m-%d}:{','.join(sorted(c.lower() for c in categories))}"
+    return cachedProviderCall(db, key, fetch)
+
+def gatherActivities(db, city, start_date, end_date, google_categories, ticketmaster_categories):
+    """Places for each Google category plus Ticketmaster events, served from the provider cache when fresh."""
+    results = []
+    for category in google_categories:
+        results.extend(fetchGooglePlaces(db, city, category))
+    results.extend(fetchTicketmasterEvents(db, city, start_date, end_date, ticketmaster_categories))
+    return results
+
 @activities_bp.route("/activities/search", methods=["POST"]) 
 def search_activities():
     data = request.get_json()
@@ -46,86 +181,15 @@ def search_activities():
         print(f"Parsed categories: Google={google_categories}, Ticketmaster={ticketmaster_categories}")
     else:
         # If categories is already a list, use it directly
-        google_categories = categories_input or ["restaurant", "tourist_attraction"]
-        ticketmaster_categories = ["music"]  # Default for Ticketmaster
+        google_categories = categories_input or DEFAULT_GOOGLE_CATEGORIES
+        ticketmaster_categories = DEFAULT_TICKETMASTER_CATEGORIES  # Default for Ticketmaster
         parsing_explanation = "Categories provided as list"
 
-    results = []
-
-    # Google Places search using parsed categories
-    for category in google_categories:
-        url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-        params = {
-            "query": f"{category} in {city}",
-            "key": GOOGLE_API_KEY
-        }
-        try:
-            res = requests.get(url, params=params).json()
-            for place in res.get("results", []):
-                results.append({
-                    "name": place.get("name"),
-                    "tags": [category],
-                    "location": city,
-                    "address": place.get("formatted_address")
-                })
-        except Exception as e:
-            print(f"Error fetching Google Places data for {category}: {e}")
-
-    start_datetime = start_date.isoformat() + "Z"
-    end_datetime = end_date.isoformat() + "Z"
-
-    # Build category (classification) filter for Ticketmaster
-    segment_ids = {
-        "music": "KZFzniwnSyZfZ7v7nJ",
-        "sports": "KZFzniwnSyZfZ7v7nE",
-        "arts": "KZFzniwnSyZfZ7v7na",
-        "film": "KZFzniwnSyZfZ7v7nn",
-        "misc": "KZFzniwnSyZfZ7v7n1"
-    }
-    
-    classification_filter = ','.join([segment_ids.get(cat.lower(), '') for cat in ticketmaster_categories if cat.lower() in segment_ids])
-
-    params = {
-        "apikey": TICKETMASTER_API_KEY,
-        "city": city,
-        "startDateTime": start_datetime,
-        "endDateTime": end_datetime,
-        "size": 20,
-        "sort": "date,asc"
-    }
-
-    if classification_filter:
-        params["segmentId"] = classification_filter
-
-    response = requests.get("https://app.ticketmaster.com/discovery/v2/events.json", params=params)
-
-    if response.status_code != 200:
-        return jsonify({"error": "Ticketmaster API error", "details": response.text}), 502
-
-    data = response.json()
-    events = data.get("_embedded", {}).get("events", [])
-
-    for e in events:
-        # Handle price
-        price_info = e.get("priceRanges", [])
-        if price_info and isinstance(price_info, list):
-            price = {
-                "min": price_info[0].get("min"),
-                "max": price_info[0].get("max"),
-                "currency": price_info[0].get("currency")
-            }
-        else:
-            price = {}
-
-        results.append({
-            "name": e.get("name"),
-            # "url": e.get("url"),
-            "start_date": e.get("dates", {}).get("start", {}).get("localDate"),
-            "start_time": e.get("dates", {}).get("start", {}).get("localTime"),
-            "address": e.get("_embedded", {}).get("venues", [{}])[0].get("name"),
-            "location": e.get("_embedded", {}).get("venues", [{}])[0].get("city", {}).get("name"),
-             "price": price
-        })
+    db = current_app.config["DB"]
+    try:
+        results = gatherActivities(db, city, start_date, end_date, google_categories, ticketmaster_categories)
+    except TicketmasterError as e:
+        return jsonify({"error": "Ticketmaster API error", "details": str(e)}), 502
 
     # # Eventbrite search
     # tm_url = "https://app.ticketmaster.com/discovery/v2/events"
@@ -167,11 +231,10 @@ def search_activities():
         }
     }
 
-    db = current_app.config["DB"]
-    user_info_res, status = getUserByEmail(db, user_email)
-    user_info_temp = user_info_res.get_json()
-    user_info = user_info_temp["user"]
-    gemini_prompt = generate_itinerary_json(
+    user_info = get_user_profile(db, email=user_email)
+    if not user_info:
+        return jsonify({"error": "User not found"}), 404
+    itinerary = generate_itinerary_json(
         location=city,
         interests=user_info.get("interests", []),
         activities_response=response,
@@ -180,10 +243,142 @@ def search_activities():
         start_date=start_date_str,
         end_date=end_date_str,
         user_email=user_email,
+        db=db,
         trip_name=trip_name,
-        user_id=user_info["_id"]
+        user_id=user_info["_id"],
+        categories={"google": google_categories, "ticketmaster": ticketmaster_categories}
     )
 
     response["itinerary"] = itinerary
     
     return jsonify(response), 200
+
+# Candidate activities shown to Gemini when replanning one day or slot
+REGENERATE_ACTIVITY_LIMIT = 15
+
+def itemInWindow(item, day, window):
+    """True if a Gemini item starts at a valid HH:MM on day and, when given, inside the start-end window."""
+    try:
+        start = datetime.strptime(str(item.get("start_time", "")), "%H:%M").strftime("%H:%M")
+    except ValueError:
+        return False
+    item_day = item.get("date") or item.get("day")
+    if item_day and item_day != day:
+        return False
+    return window is None or window[0] <= start < window[1]
+
+@activities_bp.route("/itineraries/<itinerary_id>/regenerate", methods=["POST"])
+def regenerate_itinerary(itinerary_id):
+    """
+    Replan one day (or one start_time-end_time slot of it) of a saved itinerary.
+
+    Only the items in that window are replaced. The rest of the day is sent to
+    Gemini as fixed context, candidates come from the provider cache, and
+    itineraries.event_ids gets a minimal $pull/$push diff.
+    """
+    db = current_app.config["DB"]
+    data = request.get_json() or {}
+    day = data.get("day")
+    start_time = data.get("start_time")
+    end_time = data.get("end_time")
+
+    try:
+        day_date = datetime.strptime(day or "", "%Y-%m-%d").date()
+        window = (start_time, end_time) if start_time or end_time else None
+        if window:
+            datetime.strptime(start_time or "", "%H:%M")
+            datetime.strptime(end_time or "", "%H:%M")
+    except ValueError:
+        return jsonify({"error": "day must be YYYY-MM-DD and start_time/end_time HH:MM"}), 400
+
+    if window and start_time >= end_time:
+        return jsonify({"error": "start_time must be before end_time"}), 400
+    if not ObjectId.is_valid(itinerary_id):
+        return jsonify({"error": "Invalid itinerary id"}), 400
+
+    itinerary = db.itineraries.find_one({"_id": ObjectId(itinerary_id)})
+    if not itinerary:
+        return jsonify({"error": "Itinerary not found"}), 404
+    try:
+        date_from = datetime.strptime(itinerary.get("date_from") or "", "%Y-%m-%d")
+        date_to = datetime.strptime(itinerary.get("date_to") or "", "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return jsonify({"error": "Itinerary has no valid date range"}), 400
+    if not date_from.date() <= day_date <= date_to.date():
+        return jsonify({"error": f"day must be between {itinerary['date_from']} and {itinerary['date_to']}"}), 400
+    user_id = str(itinerary["user_id"])
+    location = itinerary["location"]
+
+    # Split the itinerary into the items being replaced and the ones that stay
+    scheduled = list(db.events.find({"_id": {"$in": itinerary.get("event_ids", [])}}, {"name": 1, "time": 1}).sort("time", 1))
+    replaced, kept_items, planned_names = [], [], []
+    for event in scheduled:
+        if event["time"].date() != day_date:
+            planned_names.append(event["name"])
+        elif window is None or start_time <= event["time"].strftime("%H:%M") < end_time:
+            replaced.append(str(event["_id"]))
+        else:
+            kept_items.append({"name": event["name"], "start_time": event["time"].strftime("%H:%M")})
+
+    categories = data.get("categories") or itinerary.get("categories") or {}
+    try:
+        activities = gatherActivities(
+            db, location, date_from, date_to,
+            categories.get("google", DEFAULT_GOOGLE_CATEGORIES),
+            categories.get("ticketmaster", DEFAULT_TICKETMASTER_CATEGORIES)
+        )
+    except TicketmasterError as e:
+        return jsonify({"error": "Ticketmaster API error", "details": str(e)}), 502
+
+    # Drop what is already planned, repeats across categories and events dated on other days
+    taken = {normalize_name(name) for name in planned_names + [k["name"] for k in kept_items]}
+    candidates = []
+    for a in activities:
+        key = normalize_name(a.get("name"))
+        if not key or key in taken or a.get("start_date") not in (None, day):
+            continue
+        taken.add(key)
+        candidates.append(a)
+    activities = candidates[:REGENERATE_ACTIVITY_LIMIT]
+
+    try:
+        items = regenerate_itinerary_items(
+            location, day, window, kept_items, planned_names, activities,
+            user_info=get_user_profile(db, user_id=user_id),
+            budget=data.get("budget", "medium"),
+            instructions=data.get("instructions")
+        )
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 502
+
+    # Gemini sometimes schedules outside the requested day or slot; those items are dropped
+    items = [item for item in items if isinstance(item, dict) and item.get("name") and itemInWindow(item, day, window)]
+    if not items:
+        return jsonify({"error": "Gemini returned no items inside the requested window"}), 502
+
+    new_ids = saveItineraryEvents(db, items, day, location, user_id)
+    existing = {str(eid) for eid in itinerary.get("event_ids", [])}
+    removed = [eid for eid in replaced if eid not in set(new_ids)]
+    added = [eid for eid in dict.fromkeys(new_ids) if eid not in existing]
+
+    # $pull and $push can't target the same array in one update
+    if removed:
+        db.itineraries.update_one({"_id": itinerary["_id"]}, {"$pull": {"event_ids": {"$in": [ObjectId(eid) for eid in removed]}}})
+    if added:
+        db.itineraries.update_one({"_id": itinerary["_id"]}, {"$push": {"event_ids": {"$each": [ObjectId(eid) for eid in added]}}})
+
+    # Leave events the user no longer plans to attend, unless another itinerary still has them
+    for eid in removed:
+        if not db.itineraries.find_one({"user_id": itinerary["user_id"], "event_ids": ObjectId(eid)}, {"_id": 1}):
+            removeAttendance(db, eid, user_id)
+    if added:
+        enqueue_matches_for_user(db, user_id, added)
+
+    return jsonify({
+        "itinerary_id": itinerary_id,
+        "day": day,
+        "items": items,
+        "added": added,
+        "removed": removed
+    }), 200
+
@@ -1,10 +1,123 @@
+import os
 from flask import Blueprint, request, jsonify, current_app
-from datetime import datetime
+from datetime import datetime, timedelta
 from bson import ObjectId
+import json
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from app.models.event import Event
+from app.models.attendance import Attendance
+from app.match_queue import enqueue_matches_for_user
+from routes.db.user_routes import USER_SUMMARY_PROJECTION
+from app.pagination import encode_cursor, decode_cursor, keyset_filter, clamp_limit
 
 events_bp = Blueprint("events", __name__)
 
+# Events per insert_many / bulk_write round trip in /events/bulk
+BULK_BATCH_SIZE = 1000
+
+# Attendees hydrated per event in GET /events; the rest are paged through /events/<id>/attendees
+EVENT_ATTENDEE_PREVIEW = int(os.getenv("EVENT_ATTENDEE_PREVIEW", "20"))
+
+def record_attendance(event_id, user_id, event_time):
+    graph = current_app.config.get("COATTENDANCE_GRAPH")
+    if graph is not None:
+        graph.add_attendance(event_id, user_id, event_time)
+
+def forget_attendance(event_id, user_id):
+    graph = current_app.config.get("COATTENDANCE_GRAPH")
+    if graph is not None:
+        graph.remove_attendance(event_id, user_id)
+
+def index_event(event_id, event):
+    index = current_app.config.get("EVENT_IDENTITY_INDEX")
+    if index is not None:
+        index.add(event_id, event["name"], event["location"], event["time"])
+
+def popularity_row(event_id, event):
+    """Upsert that seeds an event's row in the per-city, per-day popularity table."""
+    return UpdateOne(
+        {"_id": ObjectId(event_id)},
+        {"$setOnInsert": {
+            "location": event["location"],
+            "day": datetime.combine(event["time"].date(), datetime.min.time()),
+            "name": event["name"],
+            "time": event["time"],
+            "attendees": event.get("attendee_count", 0)
+        }},
+        upsert=True
+    )
+
+def backfillEventPopularity(db):
+    """Build event_popularity from events in one server-side pass; only needed once."""
+    if db.event_popularity.estimated_document_count() > 0:
+        return
+    db.events.aggregate([
+        {"$project": {
+            "location": 1,
+            "name": 1,
+            "time": 1,
+            "day": {"$dateTrunc": {"date": "$time", "unit": "day"}},
+            "attendees": {"$ifNull": ["$attendee_count", 0]}
+        }},
+        {"$merge": {"into": "event_popularity", "whenMatched": "keepExisting"}}
+    ])
+
+def getTrendingEvents(db, location, from_day, to_day, n=10):
+    """Top-n events by attendees in a city between two days, from one indexed query."""
+    rows = db.event_popularity.find(
+        {"location": location, "day": {"$gte": from_day, "$lte": to_day}},
+        {"name": 1, "time": 1, "attendees": 1}
+    ).sort("attendees", -1).limit(n)
+    return [
+        {"_id": r["_id"], "name": r["name"], "time": r["time"], "attendees": r["attendees"]}
+        for r in rows
+    ]
+
+def addAttendance(db, event_id, user_id, event_time):
+    """Insert one attendance row and bump the event's counter; False if already attending."""
+    try:
+        db.event_attendance.insert_one(Attendance(event_id, user_id).to_dict())
+    except DuplicateKeyError:
+        return False
+    db.events.update_one({"_id": ObjectId(event_id)}, {"$inc": {"attendee_count": 1}})
+    db.event_popularity.update_one({"_id": ObjectId(event_id)}, {"$inc": {"attendees": 1}})
+    record_attendance(event_id, user_id, event_time)
+    return True
+
+def removeAttendance(db, event_id, user_id):
+    """Delete one attendance row and drop the event's counter; False if the user wasn't attending."""
+    result = db.event_attendance.delete_one({"event_id": ObjectId(event_id), "user_id": ObjectId(user_id)})
+    if result.deleted_count == 0:
+        return False
+    db.events.update_one({"_id": ObjectId(event_id)}, {"$inc": {"attendee_count": -1}})
+    db.event_popularity.update_one({"_id": ObjectId(event_id)}, {"$inc": {"attendees": -1}})
+    # Tombstone so other workers drop the edge from their co-attendance graphs too
+    db.attendance_removals.insert_one({"event_id": ObjectId(event_id), "user_id": ObjectId(user_id), "removed_at": datetime.utcnow()})
+    forget_attendance(event_id, user_id)
+    return True
+
+def migrateEmbeddedUsers(db):
+    """Move legacy events.users arrays into event_attendance. Safe to run repeatedly."""
+    for event in db.events.find({"users": {"$exists": True}}, {"users": 1}):
+        ops = [
+            UpdateOne(
+                {"event_id": event["_id"], "user_id": ObjectId(uid)},
+                {"$setOnInsert": Attendance(event["_id"], uid).to_dict()},
+                upsert=True
+            )
+            for uid in event.get("users", [])
+        ]
+        if ops:
+            db.event_attendance.bulk_write(ops, ordered=False)
+        db.events.update_one(
+            {"_id": event["_id"]},
+            {
+                "$set": {"attendee_count": db.event_attendance.count_documents({"event_id": event["_id"]})},
+                "$unset": {"users": ""}
+            }
+        )
+
 def insertEvent(db, data):
     db = current_app.config["DB"]
     try:
@@ -19,6 +132,10 @@ def insertEvent(db, data):
         )
         event = event_obj.to_dict()
         result = db.events.insert_one(event)
+        index_event(result.inserted_id, event)
+        db.event_popularity.bulk_write([popularity_row(result.inserted_id, event)])
+        for user_id in event_obj.users:
+            addAttendance(db, result.inserted_id, user_id, event["time"])
         return jsonify({"_id": str(result.inserted_id)}), 201
     except Exception as e:
         print(e)
@@ -30,29 +147,138 @@ def create_event():
     data = request.json
     return insertEvent(db, data)
 
-def updateEventWithUser(db, data):
+def _iter_bulk_items():
+    """Yield raw items from a JSON array body or an NDJSON stream (one event per line)."""
+    if "ndjson" in (request.content_type or ""):
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield e
+    else:
+        items = request.get_json()
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array of events")
+        yield from items
+
+def _write_event_batch(db, batch, upsert, results):
+    """Write one batch of (index, event_obj, event_doc) and append per-item results."""
+    if upsert:
+        ops = [
+            UpdateOne(
+                {"name": doc["name"], "location": doc["location"], "time": doc["time"]},
+                {"$setOnInsert": doc},
+                upsert=True
+            )
+            for _, _, doc in batch
+        ]
+        try:
+            result = db.events.bulk_write(ops, ordered=False)
+            upserted, errors = result.upserted_ids, {}
+        except BulkWriteError as e:
+            upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+            errors = {err["index"]: err["errmsg"] for err in e.details.get("writeErrors", [])}
+        created = []
+        for pos, (index, event_obj, doc) in enumerate(batch):
+            if pos in errors:
+                results.append({"index": index, "status": "error", "error": errors[pos]})
+            elif pos in upserted:
+                results.append({"index": index, "status": "created", "_id": str(upserted[pos])})
+                created.append((upserted[pos], event_obj, doc))
+            else:
+                results.append({"index": index, "status": "exists"})
+        _finish_created_events(db, created)
+        return
+
+    docs = [doc for _, _, doc in batch]
+    errors = {}
+    try:
+        db.events.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        errors = {err["index"]: err["errmsg"] for err in e.details.get("writeErrors", [])}
+    created = []
+    for pos, (index, event_obj, doc) in enumerate(batch):
+        if pos in errors:
+            results.append({"index": index, "status": "error", "error": errors[pos]})
+        else:
+            # insert_many assigns _id on the client, so it's set even for a partial failure
+            results.append({"index": index, "status": "created", "_id": str(doc["_id"])})
+            created.append((doc["_id"], event_obj, doc))
+    _finish_created_events(db, created)
+
+def _finish_created_events(db, created):
+    """Index a batch of new events and seed their popularity rows in one bulk write."""
+    if not created:
+        return
+    for event_id, _, doc in created:
+        index_event(event_id, doc)
+    db.event_popularity.bulk_write([popularity_row(event_id, doc) for event_id, _, doc in created], ordered=False)
+    for event_id, event_obj, doc in created:
+        for user_id in event_obj.users:
+            addAttendance(db, event_id, user_id, doc["time"])
+
+@events_bp.route("/events/bulk", methods=["POST"])
+def bulk_create_events():
+    """
+    Ingest many events at once from a JSON array or an NDJSON stream.
+
+    Items are validated through Event and written in unordered batches. With
+    ?upsert=1, events matching an existing (name, location, time) are left alone
+    and reported as "exists". Returns one result per input item.
+    """
+    db = current_app.config["DB"]
+    upsert = request.args.get("upsert") == "1"
+    results = []
+    batch = []
+
+    try:
+        for index, item in enumerate(_iter_bulk_items()):
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                event_obj = Event(
+                    name=item["name"],
+                    location=item["location"],
+                    time=item["time"],
+                    desc=item.get("desc", ""),
+                    users=item.get("users", [])
+                )
+                batch.append((index, event_obj, event_obj.to_dict()))
+            except Exception as e:
+                results.append({"index": index, "status": "error", "error": str(e)})
+
+            if len(batch) >= BULK_BATCH_SIZE:
+                _write_event_batch(db, batch, upsert, results)
+                batch = []
+
+        if batch:
+            _write_event_batch(db, batch, upsert, results)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    results.sort(key=lambda r: r["index"])
+    summary = {status: sum(1 for r in results if r["status"] == status) for status in ("created", "exists", "error")}
+    return jsonify({**summary, "results": results}), 200
+
+def updateEventWithUser(db, data, event_id):
     user_id = data.get("user_id")
 
     if not user_id:
         return jsonify({"error": "Missing user_id in request body"}), 400
 
     try:
-        event = db.events.find_one({"_id": ObjectId(event_id)})
+        event = db.events.find_one({"_id": ObjectId(event_id)}, {"time": 1})
         if not event:
             return jsonify({"error": "Event not found"}), 404
 
-        user_obj_id = ObjectId(user_id)
-
-        # Prevent duplicate entries
-        if user_obj_id in event.get("users", []):
-            return jsonify({"message": "User already added"}), 200
-
-        db.events.update_one(
-            {"_id": ObjectId(event_id)},
-            {"$addToSet": {"users": user_obj_id}}
-        )
+        # The unique (event_id, user_id) index prevents duplicate entries
+        if not addAttendance(db, event["_id"], user_id, event.get("time")):
+            return jsonify({"message": "User already added", "added": False}), 200
 
-        return jsonify({"message": "User added to event"}), 200
+        return jsonify({"message": "User added to event", "added": True}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -61,7 +287,11 @@ def updateEventWithUser(db, data):
 def add_user_to_event(event_id):
     db = current_app.config["DB"]
     data = request.get_json()
-    return updateEventWithUser(db, data)
+    response, status = updateEventWithUser(db, data, event_id)
+    if status == 200 and response.get_json()["added"]:
+        # Score the new attendee against everyone already going, off the request path
+        enqueue_matches_for_user(db, data["user_id"], [event_id])
+    return response, status
 
 
 @events_bp.route("/events", methods=["GET"])
@@ -70,6 +300,8 @@ def get_events():
     location = request.args.get("location")
     from_date = request.args.get("from")
     to_date = request.args.get("to")
+    cursor = request.args.get("cursor")
+    limit = clamp_limit(request.args.get("limit", type=int))
 
     query = {}
     if location:
@@ -79,27 +311,147 @@ def get_events():
             "$gte": datetime.strptime(from_date, "%Y-%m-%d"),
             "$lte": datetime.strptime(to_date, "%Y-%m-%d")
         }
+    if cursor:
+        try:
+            last_time, last_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query = {"$and": [query, keyset_filter("time", last_time, last_id)]}
 
-    events = list(db.events.find(query))
-    for event in events:
-        event["_id"] = str(event["_id"])
-        event["time"] = event["time"].strftime("%Y-%m-%dT%H:%M")
+    # attendees=count skips hydration and only returns how many users are going
+    attendees_count_only = request.args.get("attendees") == "count"
 
-        user_ids = event.get("users", [])
+    # Walk the (location, time, _id) index one page at a time; fetch one extra row to know if there's more
+    events = list(
+        db.events.find(query)
+        .sort([("time", 1), ("_id", 1)])
+        .limit(limit + 1)
+    )
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = encode_cursor(events[-1]["time"], events[-1]["_id"])
+
+    if attendees_count_only:
+        for event in events:
+            event["user_count"] = event.get("attendee_count", 0)
+    else:
+        # Hydrate up to EVENT_ATTENDEE_PREVIEW attendees per event: one aggregation whose
+        # per-event $limit walks the (event_id, _id) index, then one users query
+        rows = db.events.aggregate([
+            {"$match": {"_id": {"$in": [e["_id"] for e in events]}}},
+            {"$lookup": {
+                "from": "event_attendance",
+                "localField": "_id",
+                "foreignField": "event_id",
+                "as": "attendance",
+                "pipeline": [
+                    {"$sort": {"_id": 1}},
+                    {"$limit": EVENT_ATTENDEE_PREVIEW},
+                    {"$project": {"user_id": 1}}
+                ]
+            }},
+            {"$project": {"attendance.user_id": 1}}
+        ])
+        attendance = {row["_id"]: [a["user_id"] for a in row["attendance"]] for row in rows}
+        user_ids = {uid for uids in attendance.values() for uid in uids}
+        users = {}
         if user_ids:
-            users = list(db.users.find({"_id": {"$in": user_ids}}))
-            for user in users:
-                user["_id"] = str(user["_id"])
-            event["users"] = users
+            for user in db.users.find({"_id": {"$in": list(user_ids)}}, USER_SUMMARY_PROJECTION):
+                users[user["_id"]] = user
+
+        for event in events:
+            event["users"] = [users[uid] for uid in attendance.get(event["_id"], []) if uid in users]
+            event.setdefault("attendee_count", len(event["users"]))
+
+    # The body stays a bare array for existing clients; the next page's cursor rides in a header
+    response = jsonify(events)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
+
+@events_bp.route("/events/trending", methods=["GET"])
+def get_trending_events():
+    db = current_app.config["DB"]
+    location = request.args.get("location")
+    from_date = request.args.get("from")
+    to_date = request.args.get("to")
+    n = clamp_limit(request.args.get("n", type=int), default=10, maximum=100)
+
+    if not location:
+        return jsonify({"error": "Missing required query parameter: location"}), 400
 
-    return jsonify(events), 200
+    try:
+        # Default to the coming week
+        from_day = datetime.strptime(from_date, "%Y-%m-%d") if from_date else datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        to_day = datetime.strptime(to_date, "%Y-%m-%d") if to_date else from_day + timedelta(days=6)
+        return jsonify(getTrendingEvents(db, location, from_day, to_day, n)), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@events_bp.route("/events/<event_id>/attendees", methods=["GET"])
+def get_event_attendees(event_id):
+    db = current_app.config["DB"]
+    cursor = request.args.get("cursor")
+    limit = clamp_limit(request.args.get("limit", type=int))
+
+    try:
+        query = {"event_id": ObjectId(event_id)}
+        if cursor:
+            _, last_id = decode_cursor(cursor)
+            query["_id"] = {"$gt": last_id}
+
+        rows = list(db.event_attendance.find(query).sort("_id", 1).limit(limit + 1))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(None, rows[-1]["_id"])
+
+        users = {
+            u["_id"]: u
+            for u in db.users.find({"_id": {"$in": [r["user_id"] for r in rows]}}, USER_SUMMARY_PROJECTION)
+        }
+        attendees = [
+            {**users[r["user_id"]], "joined_at": r["joined_at"]}
+            for r in rows
+            if r["user_id"] in users
+        ]
+        return jsonify({"attendees": attendees, "next_cursor": next_cursor}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@events_bp.route("/users/<user_id>/events", methods=["GET"])
+def get_user_events(user_id):
+    db = current_app.config["DB"]
+    cursor = request.args.get("cursor")
+    limit = clamp_limit(request.args.get("limit", type=int))
+
+    try:
+        query = {"user_id": ObjectId(user_id)}
+        if cursor:
+            _, last_id = decode_cursor(cursor)
+            query["_id"] = {"$gt": last_id}
+
+        rows = list(db.event_attendance.find(query, {"event_id": 1}).sort("_id", 1).limit(limit + 1))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(None, rows[-1]["_id"])
+
+        events = list(db.events.find({"_id": {"$in": [r["event_id"] for r in rows]}}).sort("time", 1))
+        return jsonify({"events": events, "next_cursor": next_cursor}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
 
 def getEventByDetails(db, name, location, time_str):
     if not name or not location or not time_str:
         return jsonify({"error": "Missing required query parameters: name, location, time"}), 400
 
     try:
-        event_time = datetime.strptime(time_str, "%Y-%m-%dT%H:%M")
+        event_time = datetime.fromisoformat(time_str)  # "YYYY-MM-DDTHH:MM", seconds optional
         event = db.events.find_one({
             "name": name,
             "location": location,
@@ -109,13 +461,20 @@ def getEventByDetails(db, name, location, time_str):
         if not event:
             return jsonify({"exists": False}), 200
 
-        event["_id"] = str(event["_id"])
-        event["time"] = event["time"].strftime("%Y-%m-%dT%H:%M")
         return jsonify({"exists": True, "event": event}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+def resolveEventId(db, name, location, time_str):
+    """Canonical id of an existing event that is probably the same as (name, location, time), else None."""
+    event_time = datetime.strptime(time_str, "%Y-%m-%dT%H:%M")
+    index = current_app.config.get("EVENT_IDENTITY_INDEX")
+    if index is None:
+        event = db.events.find_one({"name": name, "location": location, "time": event_time}, {"_id": 1})
+        return str(event["_id"]) if event else None
+    return index.resolve(db, name, location, event_time)
+
 @events_bp.route("/events/search", methods=["GET"])
 def search_event_by_details():
     db = current_app.config["DB"]
@@ -1,42 +1,92 @@
 from flask import Blueprint, request, jsonify, current_app
 from bson import ObjectId
 from app.models.itinerary import Itinerary  # adjust path as needed
+from app.match_queue import enqueue_matches_for_user
+from app.pagination import encode_cursor, decode_cursor, clamp_limit
 
 itins_bp = Blueprint("itineraries", __name__)
 
-def insertItinerary(data):
-    db = current_app.config["DB"]
+# Event fields embedded in itineraries (no attendee lists)
+ITINERARY_EVENT_PROJECTION = {"name": 1, "location": 1, "time": 1, "desc": 1, "attendee_count": 1}
+
+def insertItinerary(db, data):
     try:
-        itinerary = {
-            "user_id": data["user_id"],
-            "location": data["location"],
-            "date_from": data["date_from"],
-            "date_to": data["date_to"],
-            "event_ids": data.get("event_ids", []),
-            "trip_name": data["trip_name"]
-        }
-        result = db.itineraries.insert_one(itinerary)
+        itinerary = Itinerary(
+            user_id=data["user_id"],
+            location=data["location"],
+            date_from=data["date_from"],
+            date_to=data["date_to"],
+            event_ids=data.get("event_ids", []),
+            trip_name=data["trip_name"],
+            categories=data.get("categories")
+        )
+        result = db.itineraries.insert_one(itinerary.to_dict())
         return jsonify({"_id": str(result.inserted_id)}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+def migrateItineraryIds(db):
+    """Convert itineraries saved with string user_id/event_ids to ObjectIds. Safe to run repeatedly."""
+    for itin in db.itineraries.find(
+        {"$or": [{"user_id": {"$type": "string"}}, {"event_ids": {"$elemMatch": {"$type": "string"}}}]},
+        {"user_id": 1, "event_ids": 1}
+    ):
+        db.itineraries.update_one(
+            {"_id": itin["_id"]},
+            {"$set": {
+                "user_id": ObjectId(itin["user_id"]),
+                "event_ids": [ObjectId(eid) for eid in itin.get("event_ids", [])]
+            }}
+        )
+
 @itins_bp.route("/itineraries", methods=["POST"])
 def create_itinerary():
     db = current_app.config["DB"]
     data = request.json
-    return insertItinerary(db, data)
+    response, status = insertItinerary(db, data)
+    if status == 201 and data.get("event_ids"):
+        enqueue_matches_for_user(db, data["user_id"], data["event_ids"])
+    return response, status
 
 @itins_bp.route("/itineraries/user/<user_id>", methods=["GET"])
 def get_user_itineraries(user_id):
+    """
+    A user's itineraries, newest first, one keyset page at a time. With
+    include=events each itinerary embeds its events (sorted by time) through a
+    single $lookup aggregation instead of one request per itinerary.
+    """
     db = current_app.config["DB"]
     try:
-        itineraries = list(db.itineraries.find({"user_id": ObjectId(user_id)}))
-        for itin in itineraries:
-            itin["_id"] = str(itin["_id"])
-            itin["user_id"] = str(itin["user_id"])
-            itin["event_ids"] = [str(eid) for eid in itin["event_ids"]]
-            itin["trip_name"] = str(itin["trip_name"])
-        return jsonify(itineraries), 200
+        limit = clamp_limit(request.args.get("limit", type=int), default=20, maximum=100)
+        match = {"user_id": ObjectId(user_id)}
+        cursor = request.args.get("cursor")
+        if cursor:
+            _, last_id = decode_cursor(cursor)
+            match["_id"] = {"$lt": last_id}
+
+        pipeline = [
+            {"$match": match},
+            {"$sort": {"_id": -1}},
+            {"$limit": limit + 1}
+        ]
+        if request.args.get("include") == "events":
+            pipeline.append({"$lookup": {
+                "from": "events",
+                "localField": "event_ids",
+                "foreignField": "_id",
+                "as": "events",
+                "pipeline": [
+                    {"$sort": {"time": 1}},
+                    {"$project": ITINERARY_EVENT_PROJECTION}
+                ]
+            }})
+
+        itineraries = list(db.itineraries.aggregate(pipeline))
+        next_cursor = encode_cursor(None, itineraries[limit - 1]["_id"]) if len(itineraries) > limit else None
+        response = jsonify(itineraries[:limit])
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response, 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
@@ -48,13 +98,7 @@ def get_itinerary_events(itinerary_id):
         if not itinerary:
             return jsonify({"error": "Itinerary not found"}), 404
 
-        events = list(db.events.find({"_id": {"$in": itinerary["event_ids"]}}))
-        events.sort(key=lambda e: e.get("time", None))
-
-        for event in events:
-            event["_id"] = str(event["_id"])
-            event["time"] = event["time"].strftime("%Y-%m-%dT%H:%M")
-
+        events = list(db.events.find({"_id": {"$in": itinerary["event_ids"]}}, ITINERARY_EVENT_PROJECTION).sort("time", 1))
         return jsonify(events), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify, current_app
 from bson import ObjectId
 from app.models.matches import Match  # adjust import path as needed
+from app.match_queue import enqueue_matches_for_user, get_match_job_stats
+from app.top_matches import get_top_matches
+from app.match_ranker import get_ranking_stats
 
 matches_bp = Blueprint("matches", __name__)
 
@@ -27,8 +30,39 @@ def create_match_entry():
 def generate_matches():
     db = current_app.config["DB"]
     data = request.get_json()
+    user_id = data.get("user_id")
 
-    return "Success"
+    if not user_id:
+        return jsonify({"error": "Missing user_id in request body"}), 400
+
+    try:
+        top_k = None if data.get("top_k") is None else int(data["top_k"])
+        min_score = None if data.get("min_score") is None else float(data["min_score"])
+    except (TypeError, ValueError):
+        return jsonify({"error": "top_k must be an integer and min_score a number"}), 400
+    if top_k is not None and top_k < 0:
+        return jsonify({"error": "top_k must be >= 0"}), 400
+    if min_score is not None and not 0 <= min_score <= 100:
+        return jsonify({"error": "min_score must be between 0 and 100"}), 400
+
+    try:
+        if data.get("event_id"):
+            event_ids = [data["event_id"]]
+        else:
+            # Mongo, not the in-process graph: attendance written by other workers must count
+            event_ids = [str(eid) for eid in db.event_attendance.distinct("event_id", {"user_id": ObjectId(user_id)})]
+
+        # Ranking runs on the match worker; /match_jobs/stats shows progress
+        enqueue_matches_for_user(db, user_id, event_ids, top_k=top_k, min_score=min_score)
+        return jsonify({"message": "Match ranking queued", "events": len(event_ids)}), 202
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@matches_bp.route("/match_jobs/stats", methods=["GET"])
+def match_job_stats():
+    db = current_app.config["DB"]
+    return jsonify({"jobs": get_match_job_stats(db), "ranking": get_ranking_stats()}), 200
 
 @matches_bp.route("/matches", methods=["GET"])
 def get_all_matches():
@@ -36,20 +70,27 @@ def get_all_matches():
     try:
         all_matches = list(db.matches.find({}))
         for m in all_matches:
-            m["_id"] = str(m["_id"])
-            m["user_id"] = str(m["user_id"])
-            m["event_id"] = str(m["event_id"])
-
-            # Convert matched_user_id and sort by score descending
-            matches_list = m.get("matches", [])
-            for match in matches_list:
-                match["matched_user_id"] = str(match["matched_user_id"])
-
-            m["matches"] = sorted(matches_list, key=lambda x: x.get("score", 0), reverse=True)
+            # Sort by score descending
+            m["matches"] = sorted(m.get("matches", []), key=lambda x: x.get("score", 0), reverse=True)
 
         return jsonify(all_matches), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+@matches_bp.route("/matches/<user_id>/candidates", methods=["GET"])
+def get_match_candidates(user_id):
+    graph = current_app.config["COATTENDANCE_GRAPH"]
+    limit = request.args.get("limit", 20, type=int)
+    return jsonify({"user_id": user_id, "candidates": graph.rank_candidates(user_id, limit)}), 200
+
+@matches_bp.route("/matches/<user_id>", methods=["GET"])
+def get_user_top_matches(user_id):
+    db = current_app.config["DB"]
+    try:
+        k = request.args.get("k", 10, type=int)
+        matches = get_top_matches(db, user_id, k)
+        return jsonify({"user_id": user_id, "matches": matches}), 200
 
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
@@ -1,31 +1,219 @@
-from flask import Blueprint, request, jsonify, current_app
-from app.models.message import Message
-from bson import ObjectId
-from datetime import datetime
+import os
+import queue
+import time
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from app.models.message import Message, conversation_id
+from app.pagination import encode_cursor, decode_cursor, keyset_filter, clamp_limit
 
 messages_bp = Blueprint('messages', __name__)
 
+# Comment line sent on idle streams so proxies and dead clients are noticed
+STREAM_HEARTBEAT_SECONDS = 15
+# Streams are closed after this long and the browser reconnects, so a worker's stream slots turn over
+STREAM_MAX_SECONDS = int(os.getenv("MESSAGE_STREAM_MAX_SECONDS", "300"))
+
+def backfillConversationIds(db):
+    """Stamp conversation_id on messages stored before it existed. Safe to run repeatedly."""
+    db.messages.update_many(
+        {"conversation_id": {"$exists": False}},
+        [{"$set": {"conversation_id": {"$cond": [
+            {"$lt": ["$from_user_id", "$to_user_id"]},
+            {"$concat": ["$from_user_id", ":", "$to_user_id"]},
+            {"$concat": ["$to_user_id", ":", "$from_user_id"]}
+        ]}}}]
+    )
+
+def backfillConversations(db):
+    """Build the conversations summary from existing messages in one server-side pass; only needed once."""
+    if db.conversations.estimated_document_count() > 0:
+        return
+    db.messages.aggregate([
+        {"$sort": {"created_at": 1}},
+        {"$group": {
+            "_id": "$conversation_id",
+            "a": {"$last": "$from_user_id"},
+            "b": {"$last": "$to_user_id"},
+            "text": {"$last": "$text"},
+            "last_at": {"$last": "$created_at"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "conversation_id": "$_id",
+            "participants": {"$cond": [{"$lt": ["$a", "$b"]}, ["$a", "$b"], ["$b", "$a"]]},
+            "last_message": {"from_user_id": "$a", "text": "$text", "created_at": "$last_at"},
+            "last_at": 1,
+            "unread": [0, 0]
+        }},
+        {"$merge": {"into": "conversations", "on": "conversation_id", "whenMatched": "keepExisting"}}
+    ])
+
+def updateConversation(db, message):
+    """
+    Fold one message into its conversations row in a single atomic upsert: bump
+    the recipient's unread count and move last_message forward (never backwards,
+    so concurrent sends can't leave an older message on top).
+    """
+    participants = sorted((message["from_user_id"], message["to_user_id"]))
+    recipient = participants.index(message["to_user_id"]) if message["from_user_id"] != message["to_user_id"] else None
+    is_newer = {"$gte": [message["created_at"], {"$ifNull": ["$last_at", message["created_at"]]}]}
+    last_message = {
+        "from_user_id": message["from_user_id"],
+        "text": message["text"],
+        "created_at": message["created_at"]
+    }
+    db.conversations.update_one(
+        {"conversation_id": message["conversation_id"]},
+        [{"$set": {
+            "participants": participants,
+            "last_message": {"$cond": [is_newer, {"$literal": last_message}, "$last_message"]},
+            "last_at": {"$cond": [is_newer, message["created_at"], "$last_at"]},
+            "unread": {"$map": {
+                "input": [0, 1],
+                "as": "i",
+                "in": {"$add": [
+                    {"$ifNull": [{"$arrayElemAt": ["$unread", "$$i"]}, 0]},
+                    {"$cond": [{"$eq": ["$$i", recipient]}, 1, 0]}
+                ]}
+            }}
+        }}],
+        upsert=True
+    )
+
 @messages_bp.route('/messages', methods=['POST'])
 def send_message():
     db = current_app.config["DB"]
     data = request.json
     msg = Message(data["from_user_id"], data["to_user_id"], data["text"])
-    db.messages.insert_one(msg.to_dict())
-    return jsonify({"message": "Message sent"}), 201
+    doc = msg.to_dict()
+    db.messages.insert_one(doc)
+    updateConversation(db, doc)
+
+    bus = current_app.config.get("MESSAGE_BUS")
+    if bus is not None:
+        try:
+            bus.publish([msg.to_user_id, msg.from_user_id], {"type": "message", "message": doc})
+        except Exception as e:
+            # The message is stored; streams will catch up on the next history read
+            print(f"Error publishing message: {e}")
+    # The stored doc lets the sender show the message without waiting for the stream
+    return jsonify({"message": "Message sent", "data": doc}), 201
 
 @messages_bp.route('/messages/<user_id>/<other_user_id>', methods=['GET'])
 def get_messages(user_id, other_user_id):
+    """
+    Latest messages between two users, oldest first.
+
+    Returns at most `limit` messages. When older ones exist, the X-Next-Before
+    header holds a cursor to pass back as `before` for the previous page.
+    """
+    db = current_app.config["DB"]
+    limit = clamp_limit(request.args.get("limit", type=int))
+    query = {"conversation_id": conversation_id(user_id, other_user_id)}
+
+    before = request.args.get("before")
+    if before:
+        try:
+            created_at, last_id = decode_cursor(before)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query.update(keyset_filter("created_at", created_at, last_id, descending=True))
+
+    # Walk the (conversation_id, created_at, _id) index backwards from the newest message
+    messages = list(
+        db.messages.find(query)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    next_before = encode_cursor(messages[-1]["created_at"], messages[-1]["_id"]) if has_more else None
+
+    messages.reverse()
+    response = jsonify(messages)
+    if next_before:
+        response.headers["X-Next-Before"] = next_before
+    return response, 200
+
+@messages_bp.route('/messages/stream/<user_id>', methods=['GET'])
+def stream_messages(user_id):
+    """
+    Server-sent events stream of new messages to and from user_id.
+
+    Each open stream holds a server thread, so a worker serves at most
+    MESSAGE_STREAMS_PER_WORKER of them and answers 503 beyond that. Streams
+    end after STREAM_MAX_SECONDS and the browser reconnects.
+    """
+    bus = current_app.config["MESSAGE_BUS"]
+    dumps = current_app.json.dumps
+    q = bus.subscribe(user_id)
+    if q is None:
+        response = jsonify({"error": "Too many open message streams, try again later"})
+        response.headers["Retry-After"] = "30"
+        return response, 503
+
+    def events():
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        try:
+            yield "retry: 3000\n\n"
+            while time.monotonic() < deadline:
+                try:
+                    event = q.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {dumps(event)}\n\n"
+        finally:
+            bus.unsubscribe(user_id, q)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@messages_bp.route('/messages/<user_id>/<other_user_id>/read', methods=['POST'])
+def mark_read(user_id, other_user_id):
+    """Reset user_id's unread count for the conversation with other_user_id."""
     db = current_app.config["DB"]
-    # Get all messages between user_id and other_user_id
-    messages = list(db.messages.find({
-        "$or": [
-            {"from_user_id": user_id, "to_user_id": other_user_id},
-            {"from_user_id": other_user_id, "to_user_id": user_id}
-        ]
-    }).sort("created_at", 1))
-    for m in messages:
-        m["_id"] = str(m["_id"])
-        # Convert datetime to ISO string for frontend
-        if isinstance(m["created_at"], datetime):
-            m["created_at"] = m["created_at"].isoformat()
-    return jsonify(messages), 200 
\ No newline at end of file
+    participants = sorted((str(user_id), str(other_user_id)))
+    result = db.conversations.update_one(
+        {"conversation_id": conversation_id(user_id, other_user_id)},
+        {"$set": {f"unread.{participants.index(str(user_id))}": 0}}
+    )
+    if result.matched_count == 0:
+        return jsonify({"error": "Conversation not found"}), 404
+    return jsonify({"message": "Conversation marked as read"}), 200
+
+@messages_bp.route('/inbox/<user_id>', methods=['GET'])
+def get_inbox(user_id):
+    """A user's conversations, most recent first, from the (participants, last_at) index."""
+    db = current_app.config["DB"]
+    limit = clamp_limit(request.args.get("limit", type=int), default=20, maximum=100)
+    query = {"participants": user_id}
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            last_at, last_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query.update(keyset_filter("last_at", last_at, last_id, descending=True))
+
+    rows = list(
+        db.conversations.find(query)
+        .sort([("last_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    next_cursor = encode_cursor(rows[limit - 1]["last_at"], rows[limit - 1]["_id"]) if len(rows) > limit else None
+
+    conversations = []
+    for row in rows[:limit]:
+        me = row["participants"].index(user_id)
+        conversations.append({
+            "conversation_id": row["conversation_id"],
+            "other_user_id": row["participants"][1 - me],
+            "last_message": row["last_message"],
+            "last_at": row["last_at"],
+            "unread": row["unread"][me]
+        })
+    return jsonify({"conversations": conversations, "next_cursor": next_cursor}), 200
@@ -1,9 +1,15 @@
 from flask import Blueprint, request, jsonify, current_app
 from bson import ObjectId
 from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from app.models.saved import Saved
+from app.pagination import encode_cursor, decode_cursor, clamp_limit
+from routes.db.user_routes import USER_CARD_PROJECTION
 
 saved_bp = Blueprint("saved", __name__)
 
+SAVED_CHECK_LIMIT = 200
+
 # POST /api/saved - Save another user's profile
 @saved_bp.route("/saved", methods=["POST"])
 def save_user():
@@ -16,13 +22,16 @@ def save_user():
         return jsonify({"error": "Missing user_id or saved_user_id"}), 400
 
     try:
-        connection = SavedConnection(user_id, saved_user_id)
+        connection = Saved(user_id, saved_user_id)
         db.saved.insert_one(connection.to_dict())
+        graph = current_app.config.get("SAVED_GRAPH")
+        if graph is not None:
+            graph.add(user_id, saved_user_id)
         return jsonify({"message": "User saved successfully"}), 201
 
+    except DuplicateKeyError:
+        return jsonify({"message": "User already saved"}), 200
     except Exception as e:
-        if "duplicate key" in str(e).lower():
-            return jsonify({"message": "User already saved"}), 200
         return jsonify({"error": str(e)}), 400
 
 
@@ -32,11 +41,6 @@ def get_saved_users(user_id):
     db = current_app.config["DB"]
     try:
         saved = list(db.saved.find({"user_id": ObjectId(user_id)}))
-        for s in saved:
-            s["_id"] = str(s["_id"])
-            s["user_id"] = str(s["user_id"])
-            s["saved_user_id"] = str(s["saved_user_id"])
-
         return jsonify(saved), 200
 
     except Exception as e:
@@ -62,3 +66,79 @@ def check_saved():
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
+
+
+# POST /api/saved/check - Which of many candidates a user has saved, in one query
+@saved_bp.route("/saved/check", methods=["POST"])
+def check_saved_batch():
+    db = current_app.config["DB"]
+    data = request.get_json() or {}
+    user_id = data.get("user_id")
+    candidate_ids = data.get("candidate_ids")
+
+    if not user_id or not isinstance(candidate_ids, list):
+        return jsonify({"error": "Missing user_id or candidate_ids"}), 400
+    if len(candidate_ids) > SAVED_CHECK_LIMIT:
+        return jsonify({"error": f"At most {SAVED_CHECK_LIMIT} candidate_ids per request"}), 400
+
+    try:
+        rows = db.saved.find(
+            {"user_id": ObjectId(user_id), "saved_user_id": {"$in": [ObjectId(cid) for cid in candidate_ids]}},
+            {"saved_user_id": 1, "_id": 0}
+        )
+        saved_ids = {str(row["saved_user_id"]) for row in rows}
+        return jsonify({"saved": {cid: cid in saved_ids for cid in candidate_ids}}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+# GET /api/saved/<user_id>/profiles - Saved profiles joined in one aggregation, newest first
+@saved_bp.route("/saved/<user_id>/profiles", methods=["GET"])
+def get_saved_profiles(user_id):
+    db = current_app.config["DB"]
+    limit = clamp_limit(request.args.get("limit", type=int))
+
+    try:
+        match = {"user_id": ObjectId(user_id)}
+        cursor = request.args.get("cursor")
+        if cursor:
+            _, last_id = decode_cursor(cursor)
+            match["_id"] = {"$lt": last_id}
+
+        rows = list(db.saved.aggregate([
+            {"$match": match},
+            {"$sort": {"_id": -1}},
+            {"$limit": limit + 1},
+            {"$lookup": {
+                "from": "users",
+                "localField": "saved_user_id",
+                "foreignField": "_id",
+                "as": "profile",
+                "pipeline": [{"$project": USER_CARD_PROJECTION}]
+            }},
+            # Keep rows whose user is gone so the page size (and cursor) stay exact
+            {"$unwind": {"path": "$profile", "preserveNullAndEmptyArrays": True}}
+        ]))
+        next_cursor = encode_cursor(None, rows[limit - 1]["_id"]) if len(rows) > limit else None
+
+        profiles = [row["profile"] for row in rows[:limit] if row.get("profile")]
+        return jsonify({"profiles": profiles, "next_cursor": next_cursor}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+
+# GET /api/saved/<user_id>/mutual - Users who saved each other
+@saved_bp.route("/saved/<user_id>/mutual", methods=["GET"])
+def get_mutual_saves(user_id):
+    graph = current_app.config["SAVED_GRAPH"]
+    return jsonify({"user_id": user_id, "mutual": graph.mutual(user_id)}), 200
+
+
+# GET /api/saved/<user_id>/recommendations - Saved by people you saved, ranked by path count
+@saved_bp.route("/saved/<user_id>/recommendations", methods=["GET"])
+def get_saved_recommendations(user_id):
+    graph = current_app.config["SAVED_GRAPH"]
+    limit = request.args.get("limit", 20, type=int)
+    return jsonify({"user_id": user_id, "recommendations": graph.recommendations(user_id, limit)}), 200
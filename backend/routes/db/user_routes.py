@@ -1,10 +1,51 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
 from app.models.user import User
+from app.pagination import encode_cursor, decode_cursor, clamp_limit
+from app.profile_cache import get_user_profile, get_cached_profile, profile_cache, profile_changed, serialize_profile
 
 users_bp = Blueprint('users', __name__)
 
+# Lightweight user fields for embedding in lists (no profile_pic, dietary_restrictions, ...)
+USER_SUMMARY_PROJECTION = {"name": 1, "gender": 1, "interests": 1, "location": 1}
+# Summary plus picture, for rendering profile cards
+USER_CARD_PROJECTION = {**USER_SUMMARY_PROJECTION, "profile_pic": 1}
+
+USER_BULK_LIMIT = 1000
+USER_BATCH_LIMIT = 100
+
+def update_similarity_index(user):
+    index = current_app.config.get("SIMILARITY_INDEX")
+    if index is not None:
+        index.update(user)
+
+def buildUserDoc(data):
+    """Validate a request payload through User and return the document to insert."""
+    user_obj = User(
+        name=data["name"],
+        email=data["email"],
+        birthday=data["birthday"],  # still as string "YYYY-MM-DD"
+        gender=data["gender"],
+        interests=data.get("interests", []),
+        profile_pic=data.get("profile_pic", ""),
+        dietary_restrictions=data.get("dietary_restrictions", []),
+        location=data.get("location", ""),
+        travel_dates=data.get("travel_dates", {})  # optional or required, depending on use
+    )
+
+    user = user_obj.to_dict()
+    user["birthday"] = datetime.strptime(user["birthday"], "%Y-%m-%d") if user["birthday"] else "" # convert before DB insert
+    user["profile_version"] = 1  # bumped on every profile change; keys the match cache
+    user["updated_at"] = datetime.utcnow()  # lets other workers' indexes pick the user up
+    return user
+
+def user_created(user):
+    profile_changed.send(current_app._get_current_object(), user_id=str(user["_id"]), email=user["email"])
+    update_similarity_index(user)
+
 @users_bp.route('/users', methods=['POST'])
 def create_user():
     db = current_app.config["DB"]
@@ -12,26 +53,115 @@ def create_user():
 
     # Parse and sanitize input
     try:
-        user_obj = User(
-            name=data["name"],
-            email=data["email"],
-            birthday=data["birthday"],  # still as string "YYYY-MM-DD"
-            gender=data["gender"],
-            interests=data.get("interests", []),
-            profile_pic=data.get("profile_pic", ""),
-            dietary_restrictions=data.get("dietary_restrictions", []),
-            location=data.get("location", ""),
-            travel_dates=data.get("travel_dates", {})  # optional or required, depending on use
-        )
-
-        user = user_obj.to_dict()
-        user["birthday"] = datetime.strptime(user["birthday"], "%Y-%m-%d") if user["birthday"] else "" # convert before DB insert
+        user = buildUserDoc(data)
         result = db.users.insert_one(user)
+        user_created(user)
         return jsonify({"_id": str(result.inserted_id)}), 201
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+@users_bp.route('/users/bulk', methods=['POST'])
+def bulk_create_users():
+    """
+    Create many users from a JSON array. Each item is validated through User and
+    the batch is written with one unordered insert_many, so a duplicate email only
+    fails its own item. Returns one result per input item.
+    """
+    db = current_app.config["DB"]
+    items = request.json
+
+    if not isinstance(items, list):
+        return jsonify({"error": "Expected a JSON array of users"}), 400
+    if len(items) > USER_BULK_LIMIT:
+        return jsonify({"error": f"At most {USER_BULK_LIMIT} users per request"}), 400
+
+    results = [None] * len(items)
+    docs = []  # (input index, document)
+    seen_emails = set()
+    for index, item in enumerate(items):
+        try:
+            user = buildUserDoc(item)
+        except Exception as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+            continue
+        if user["email"] in seen_emails:
+            results[index] = {"index": index, "status": "duplicate_email", "email": user["email"]}
+            continue
+        seen_emails.add(user["email"])
+        docs.append((index, user))
+
+    errors = {}
+    if docs:
+        try:
+            db.users.insert_many([user for _, user in docs], ordered=False)
+        except BulkWriteError as e:
+            errors = {err["index"]: err for err in e.details.get("writeErrors", [])}
+
+    for pos, (index, user) in enumerate(docs):
+        err = errors.get(pos)
+        if err is None:
+            user_created(user)
+            results[index] = {"index": index, "status": "created", "_id": str(user["_id"])}
+        elif err.get("code") == 11000:
+            results[index] = {"index": index, "status": "duplicate_email", "email": user["email"]}
+        else:
+            results[index] = {"index": index, "status": "error", "error": err.get("errmsg")}
+
+    summary = {status: sum(1 for r in results if r["status"] == status) for status in ("created", "duplicate_email", "error")}
+    return jsonify({**summary, "results": results}), 200
+
+@users_bp.route('/users/batch', methods=['POST'])
+def batch_get_users():
+    """Fetch up to USER_BATCH_LIMIT profiles by id in one $in query, in the order requested."""
+    db = current_app.config["DB"]
+    data = request.json or {}
+    ids = data.get("ids", [])
+    fields = data.get("fields")
+
+    if not isinstance(ids, list) or not ids:
+        return jsonify({"error": "Missing ids"}), 400
+    if len(ids) > USER_BATCH_LIMIT:
+        return jsonify({"error": f"At most {USER_BATCH_LIMIT} ids per request"}), 400
+
+    try:
+        object_ids = [ObjectId(uid) for uid in ids]
+    except Exception:
+        return jsonify({"error": "Invalid user id"}), 400
+
+    projection = {field: 1 for field in fields} if fields else USER_CARD_PROJECTION
+    found = {str(u["_id"]): serialize_user(u) for u in db.users.find({"_id": {"$in": object_ids}}, projection)}
+
+    return jsonify({
+        "users": [found[uid] for uid in ids if uid in found],
+        "missing": [uid for uid in ids if uid not in found]
+    }), 200
+
+# Fields a profile update may change
+UPDATABLE_FIELDS = ["name", "birthday", "gender", "interests", "profile_pic", "dietary_restrictions", "location", "travel_dates"]
+
+def applyProfileUpdate(db, email, changes, expected_version=None):
+    """
+    Apply changes in one find_one_and_update and return the new document.
+
+    The version bump is decided on the server: profile_version only goes up if at
+    least one field really differs. With expected_version, nothing is written
+    (and None is returned) unless the stored version still matches.
+    """
+    query = {"email": email}
+    if expected_version is not None:
+        query["profile_version"] = expected_version
+
+    current_version = {"$ifNull": ["$profile_version", 0]}
+    unchanged = {"$and": [{"$eq": [f"${field}", {"$literal": value}]} for field, value in changes.items()]}
+    return db.users.find_one_and_update(
+        query,
+        [
+            {"$set": {"profile_version": {"$cond": [unchanged, current_version, {"$add": [current_version, 1]}]}}},
+            {"$set": {**{field: {"$literal": value} for field, value in changes.items()}, "updated_at": {"$literal": datetime.utcnow()}}}
+        ],
+        return_document=ReturnDocument.AFTER
+    )
 
 @users_bp.route("/users/<email>", methods=["PUT"])
 def update_user_by_email(email):
@@ -39,61 +169,104 @@ def update_user_by_email(email):
     data = request.json
 
     try:
-        # Check if user exists
-        existing_user = db.users.find_one({"email": email})
-        if not existing_user:
-            return jsonify({"error": "User not found"}), 404
+        # Only fields present in the request are candidates; an empty birthday leaves it alone
+        requested = {field: data[field] for field in UPDATABLE_FIELDS if field in data}
+        if not requested.get("birthday"):
+            requested.pop("birthday", None)
+        changes = dict(requested)
+        if "birthday" in changes:
+            changes["birthday"] = datetime.strptime(changes["birthday"], "%Y-%m-%d")
 
-        # Prepare update data
-        update_data = {
-            "name": data.get("name", existing_user.get("name", "")),
-            "birthday": datetime.strptime(data["birthday"], "%Y-%m-%d") if data.get("birthday") else existing_user.get("birthday"),
-            "gender": data.get("gender", existing_user.get("gender", "")),
-            "interests": data.get("interests", existing_user.get("interests", [])),
-            "profile_pic": data.get("profile_pic", existing_user.get("profile_pic", "")),
-            "dietary_restrictions": data.get("dietary_restrictions", existing_user.get("dietary_restrictions", "")),
-            "location": data.get("location", existing_user.get("location", "")),
-            "travel_dates": data.get("travel_dates", existing_user.get("travel_dates", {}))
-        }
+        user = None
+        cached = get_cached_profile(email=email)
+        if cached is not None and "profile_version" in cached:
+            # Diff against the cached profile so only changed fields are written
+            changed_fields = [field for field, value in requested.items() if cached.get(field) != value]
+            if changed_fields:
+                user = applyProfileUpdate(
+                    db, email,
+                    {field: changes[field] for field in changed_fields},
+                    expected_version=cached["profile_version"]
+                )
+            elif db.users.find_one({"email": email, "profile_version": cached["profile_version"]}, {"_id": 1}):
+                # Only trust "no changes" if the cached version is still the stored one
+                return jsonify({"message": "No changes made", "user": cached}), 200
 
-        # Update user in database
-        result = db.users.update_one(
-            {"email": email},
-            {"$set": update_data}
-        )
+        # Cold or stale cache: send every requested field and let the server work out what changed
+        if user is None and changes:
+            user = applyProfileUpdate(db, email, changes)
+        elif user is None:
+            user = db.users.find_one({"email": email})
 
-        if result.modified_count > 0:
-            return jsonify({"message": "User updated successfully"}), 200
-        else:
-            return jsonify({"message": "No changes made"}), 200
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        profile_changed.send(current_app._get_current_object(), user_id=str(user["_id"]), email=email)
+        update_similarity_index(user)
+        profile = serialize_profile(user)
+        profile_cache.put(profile)
+
+        return jsonify({"message": "User updated successfully", "user": profile}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 
+def serialize_user(user):
+    # Birthdays are dates; everything else is encoded by the app's JSON provider
+    if isinstance(user.get("birthday"), datetime):
+        user["birthday"] = user["birthday"].strftime("%Y-%m-%d")
+    return user
+
 @users_bp.route("/get_all_users", methods=["GET"])
 def get_all_users():
+    """
+    Page through users by _id. Optional params:
+      limit   page size (default 50, max 200)
+      cursor  X-Next-Cursor header of the previous page
+      fields  comma-separated projection, e.g. name,email,interests
+      format  "ndjson" streams every remaining user, one JSON object per line
+    """
     db = current_app.config["DB"]
-    users = list(db.users.find({}))
-    for user in users:
-        user["_id"] = str(user["_id"])
-        if "birthday" in user:
-            user["birthday"] = user["birthday"].strftime("%Y-%m-%d")
-    return jsonify(users), 200
+    cursor = request.args.get("cursor")
+    fields = request.args.get("fields")
+    projection = {field.strip(): 1 for field in fields.split(",") if field.strip()} if fields else None
+
+    query = {}
+    if cursor:
+        try:
+            _, last_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query["_id"] = {"$gt": last_id}
+
+    if request.args.get("format") == "ndjson":
+        dumps = current_app.json.dumps
+
+        def generate():
+            # The driver pulls batches of 500 from Mongo, so only one batch is in memory at a time
+            for user in db.users.find(query, projection).sort("_id", 1).batch_size(500):
+                yield dumps(serialize_user(user)) + "\n"
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    limit = clamp_limit(request.args.get("limit", type=int))
+    users = list(db.users.find(query, projection).sort("_id", 1).limit(limit + 1))
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(None, users[-1]["_id"])
+
+    response = jsonify([serialize_user(u) for u in users])
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response, 200
 
 def getUserById(db, user_id):
     try:
-        user = db.users.find_one({"_id": ObjectId(user_id)})
+        user = get_user_profile(db, user_id=user_id)
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        user["_id"] = str(user["_id"])
-        user["interests"] = user.get("interests", [])
-        user["gender"] = user.get("gender")
-        user["profile_pic"] = user.get("profile_pic")
-        if "birthday" in user:
-            user["birthday"] = user["birthday"].strftime("%Y-%m-%d")
-
         return jsonify(user), 200
 
     except Exception as e:
@@ -109,17 +282,10 @@ def getUserByEmail(db, email):
         return jsonify({"error": "Missing required query parameter: email"}), 400
 
     try:
-        user = db.users.find_one({"email": email})
+        user = get_user_profile(db, email=email)
         if not user:
             return jsonify({"exists": False}), 200
 
-        user["_id"] = str(user["_id"])
-        user["interests"] = user.get("interests", [])
-        user["gender"] = user.get("gender")
-        user["dietary_restrictions"] = user.get("dietary_restrictions", [])
-        if "birthday" in user and isinstance(user["birthday"], datetime):
-            user["birthday"] = user["birthday"].strftime("%Y-%m-%d")
-
         return jsonify({"exists": True, "user": user}), 200
 
     except Exception as e:
@@ -131,4 +297,39 @@ def get_user_by_email():
     email = request.args.get("email")
 
     return getUserByEmail(db, email)
-    
\ No newline at end of file
+
+@users_bp.route("/users/<user_id>/similar", methods=["GET"])
+def get_similar_users(user_id):
+    db = current_app.config["DB"]
+    index = current_app.config.get("SIMILARITY_INDEX")
+    if index is None:
+        return jsonify({"error": "Similarity index not available"}), 503
+
+    try:
+        k = request.args.get("k", 10, type=int)
+        neighbours = index.query(user_id, k)
+
+        # Hydrate just enough to render a card, in one query
+        ids = [ObjectId(uid) for uid, _ in neighbours]
+        profiles = {
+            str(u["_id"]): u
+            for u in db.users.find({"_id": {"$in": ids}}, {"name": 1, "interests": 1, "location": 1})
+        }
+
+        similar = []
+        for uid, similarity in neighbours:
+            profile = profiles.get(uid)
+            if not profile:
+                continue
+            similar.append({
+                "user_id": uid,
+                "name": profile.get("name"),
+                "interests": profile.get("interests", []),
+                "location": profile.get("location"),
+                "similarity": round(similarity, 3)
+            })
+
+        return jsonify(similar), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
@@ -3,10 +3,11 @@ import json
 import google.generativeai as genai
 from dotenv import load_dotenv
 from datetime import datetime
+from flask import current_app
 
-from routes.db.event_routes import insertEvent, updateEventWithUser, getEventByDetails
+from routes.db.event_routes import insertEvent, updateEventWithUser, resolveEventId, getTrendingEvents
 from routes.db.itinerary_routes import insertItinerary
-from routes.db.user_routes import getUserByEmail, getUserById
+from app.match_queue import enqueue_matches_for_user
 
 load_dotenv()
 
@@ -14,7 +15,7 @@ load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 model = genai.GenerativeModel("gemini-1.5-pro")
 
-def build_gemini_prompt(location, interests, activities_response, user_info=None, budget="medium", start_date=None, end_date=None):
+def build_gemini_prompt(location, interests, activities_response, user_info=None, budget="medium", start_date=None, end_date=None, popular_events=None):
     """
     Build Gemini prompt using the complete activity routes response.
     
@@ -26,6 +27,7 @@ def build_gemini_prompt(location, interests, activities_response, user_info=None
         budget: Budget level
         start_date: Trip start date
         end_date: Trip end date
+        popular_events: Trending events in the city for these dates (name + attendees)
     """
 
     # Extract activities from the response
@@ -62,6 +64,11 @@ def build_gemini_prompt(location, interests, activities_response, user_info=None
     - Date Range: {activities_response.get('date_range', [start_date, end_date])}
     - Available Activities: {len(activities)} activities found
     - Activity Categories: {', '.join(set([tag for activity in activities for tag in activity.get('tags', [])]))}
+    """
+        if popular_events:
+            popular = ", ".join(f"{e['name']} ({e['attendees']} going)" for e in popular_events)
+            trip_context = trip_context.rstrip() + f"""
+    - Popular With Other Travelers: {popular}
     """
         
         return f"""
@@ -82,6 +89,7 @@ def build_gemini_prompt(location, interests, activities_response, user_info=None
     3. Mix different types of activities (cultural, food, entertainment, outdoor)
     4. Ensure activities are geographically logical (group nearby locations)
     5. Include appropriate timing for each activity and leave 1 hour between activities for travel time
+    6. When it fits the traveler's interests, prefer places that are popular with other travelers
 
     Return the itinerary in **JSON format**. Each activity must include:
     - name
@@ -106,7 +114,7 @@ The format must be:
     """
 
 
-def generate_itinerary_json(location, interests, activities_response, user_info=None, budget="medium", start_date=None, end_date=None, user_email=None, db=None, trip_name=None, user_id=None):
+def generate_itinerary_json(location, interests, activities_response, user_info=None, budget="medium", start_date=None, end_date=None, user_email=None, db=None, trip_name=None, user_id=None, categories=None):
     """
     Generate itinerary using Gemini with complete activity routes response.
     
@@ -118,75 +126,133 @@ def generate_itinerary_json(location, interests, activities_response, user_info=
         budget: Budget level
         start_date: Trip start date
         end_date: Trip end date
+        categories: Provider categories the activities were fetched with, kept for later edits
     """
+    db = db if db is not None else current_app.config["DB"]
     try:
-        prompt = build_gemini_prompt(location, interests, activities_response, user_info, budget, start_date, end_date)
+        popular_events = getTrendingEvents(
+            db, location,
+            datetime.strptime(start_date, "%Y-%m-%d"),
+            datetime.strptime(end_date, "%Y-%m-%d"),
+            n=10
+        )
+        prompt = build_gemini_prompt(location, interests, activities_response, user_info, budget, start_date, end_date, popular_events)
         response = model.generate_content(prompt)
-        
-        # Clean the response text to handle markdown code blocks
-        response_text = response.text.strip()
-        
-        # Remove markdown code blocks if present
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]  # Remove ```json
-        if response_text.startswith('```'):
-            response_text = response_text[3:]  # Remove ```
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]  # Remove ```
-        
-        response_text = response_text.strip()
-        
-        # Parse the JSON
-        itinerary_json = json.loads(response_text)
-        events = []
-
-        for event in itinerary_json:
-            name = event["name"]
-            city = event["location"]
-            time_str = event['start_time']
-            
-            event_response, status_code = getEventByDetails(db, name, location, time_str)
-            event_data = event_response.get_json()
-            if event_data.get("exists"):
-                event_id = event_data["event"].get("_id")
-                data = {
-                    "user_id": user_id
-                }
-                events.append(event_id)
-            else:
-                full_time_str = f"{start_date}T{event['start_time']}" 
-                data = {
-                    "name": name,
-                    "desc": event.get("description", ""),
-                    "location": location,
-                    "time": full_time_str,
-                    "users": [user_id]
-                }
-                event_response, status = insertEvent(db, data)
-                event_data = event_response.get_json()
-                event_id = event_data["_id"]
-                events.append(event_id)
+        itinerary_json = parse_gemini_json(response.text)
+        events = saveItineraryEvents(db, itinerary_json, start_date, location, user_id)
+
         data = {
             "user_id":user_id,
-            "location":city,
+            "location":location,
             "date_from":start_date,
             "date_to":end_date,
             "event_ids":events,
-            "trip_name":trip_name
+            "trip_name":trip_name,
+            "categories":categories
         }
-        insertItinerary(data)
-        db = current_app.config["DB"]
-
-        for event in events:
-            for user in event["users"]:
-                print(user)
-                if user == user_id:
-                    continue
-                user = getUserById(db, user)
-                save_langchain_match_to_db(db, user_info, user, event["_id"])
-            
+        insertItinerary(db, data)
+
+        # Matching with co-attendees runs in the background match worker
+        enqueue_matches_for_user(db, user_id, events)
 
         return itinerary_json
         
     except Exception as e:
-        raise RuntimeError(f"Gemini failed: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Gemini failed: {str(e)}")
+
+
+def parse_gemini_json(response_text):
+    """Parse a Gemini JSON answer, tolerating markdown code fences around it."""
+    # Clean the response text to handle markdown code blocks
+    response_text = response_text.strip()
+    
+    # Remove markdown code blocks if present
+    if response_text.startswith('```json'):
+        response_text = response_text[7:]  # Remove ```json
+    if response_text.startswith('```'):
+        response_text = response_text[3:]  # Remove ```
+    if response_text.endswith('```'):
+        response_text = response_text[:-3]  # Remove ```
+    
+    return json.loads(response_text.strip())
+
+
+def saveItineraryEvents(db, items, day, location, user_id):
+    """Resolve or create an event for each itinerary item on `day`; returns their ids in order."""
+    events = []
+    for event in items:
+        name = event["name"]
+        full_time_str = f"{day}T{event['start_time']}"
+
+        # Gemini names the same place slightly differently between runs; reuse the canonical event
+        event_id = resolveEventId(db, name, location, full_time_str)
+        if event_id:
+            updateEventWithUser(db, {"user_id": user_id}, event_id)
+            events.append(event_id)
+        else:
+            data = {
+                "name": name,
+                "desc": event.get("description", ""),
+                "location": location,
+                "time": full_time_str,
+                "users": [user_id]
+            }
+            event_response, status = insertEvent(db, data)
+            event_data = event_response.get_json()
+            event_id = event_data["_id"]
+            events.append(event_id)
+    return events
+
+
+def build_regeneration_prompt(location, day, window, kept_items, planned_names, activities, user_info=None, budget="medium", instructions=None):
+    """
+    Build a small prompt that replans one day or time slot of an existing itinerary.
+
+    Args:
+        location: Destination city
+        day: Day being edited ("YYYY-MM-DD")
+        window: (start_time, end_time) "HH:MM" pair, or None for the whole day
+        kept_items: Items staying on that day (name, start_time)
+        planned_names: Names of everything else already in the itinerary
+        activities: Candidate places and events from the provider cache
+        user_info: User profile from database
+        budget: Budget level
+        instructions: Optional free-text request from the traveler
+    """
+    formatted_activities = "\n".join([
+        f"- {a['name']} ({', '.join(a.get('tags', []))}): {a.get('address', '')}"
+        for a in activities
+    ])
+    kept = "\n".join(f"- {k['start_time']}: {k['name']}" for k in kept_items) or "- (nothing)"
+    slot = f"between {window[0]} and {window[1]}" if window else "for the whole day"
+    interests = ", ".join((user_info or {}).get("interests", []))
+    dietary = (user_info or {}).get("dietary_restrictions", [])
+
+    return f"""
+    You're a helpful travel assistant editing an existing itinerary in {location} on {day} (budget: {budget}).
+    Traveler interests: {interests}. Dietary restrictions: {dietary}.
+
+    Already scheduled that day (keep these, do not overlap them):
+    {kept}
+
+    Already planned on other days (do not repeat): {", ".join(planned_names) or "nothing"}
+
+    Available Places and Events:
+    {formatted_activities}
+
+    Plan new activities {slot}, leaving 1 hour between activities for travel time.
+    {f"Traveler request: {instructions}" if instructions else ""}
+
+    Return only a JSON array of activities, each with name, description (1 sentence), location,
+    start_time ("HH:MM") and end_time ("HH:MM"). No commentary or markdown.
+    """
+
+
+def regenerate_itinerary_items(location, day, window, kept_items, planned_names, activities, user_info=None, budget="medium", instructions=None):
+    """Ask Gemini for replacement items for one day or slot; returns the parsed JSON list."""
+    prompt = build_regeneration_prompt(location, day, window, kept_items, planned_names, activities, user_info, budget, instructions)
+    try:
+        response = model.generate_content(prompt)
+        return parse_gemini_json(response.text)
+    except Exception as e:
+        raise RuntimeError(f"Gemini failed: {str(e)}")
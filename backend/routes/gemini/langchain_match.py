@@ -5,22 +5,30 @@ import re
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.output_parsers import PydanticOutputParser
-from langchain.schema import HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.messages import HumanMessage, SystemMessage
 from bson import ObjectId
+from pymongo import UpdateOne
 from flask import Blueprint, request, jsonify, current_app
 from app.models.matches import Match
+from app.top_matches import top_matches_ops
 
 load_dotenv()
 
-# Initialize LangChain with Gemini
-llm = ChatGoogleGenerativeAI(
-    model="gemini-1.5-pro",
-    google_api_key=os.getenv("GEMINI_API_KEY"),
-    temperature=0.7,
-    max_tokens=2048
-)
+_llm = None
+
+def get_llm():
+    """LangChain Gemini client, built on first use so importing this module needs no API key."""
+    global _llm
+    if _llm is None:
+        _llm = ChatGoogleGenerativeAI(
+            model="gemini-1.5-pro",
+            google_api_key=os.getenv("GEMINI_API_KEY"),
+            temperature=0.7,
+            max_tokens=2048
+        )
+    return _llm
 
 # Pydantic models for structured output
 class CompatibilityScore(BaseModel):
@@ -90,6 +98,7 @@ def fallback_match_analysis(user1: Dict[str, Any], user2: Dict[str, Any]) -> Mat
         common_interests = interests1.intersection(interests2)
         interest_score = min(100, len(common_interests) * 25)
     else:
+        common_interests = set()
         interest_score = 0
     
     # Location compatibility
@@ -232,7 +241,7 @@ def generate_langchain_match_analysis(user1: Dict[str, Any], user2: Dict[str, An
         )
         
         # Generate response using LangChain
-        response = llm.invoke(formatted_prompt)
+        response = get_llm().invoke(formatted_prompt)
         
         # Parse the structured output
         match_analysis = parser.parse(response.content)
@@ -252,61 +261,93 @@ def get_match_summary(match_analysis: MatchAnalysis, user_id: str = None, matche
         "match_score": overall_score
     }  
 
-def save_langchain_match_to_db(db, user1: dict, user2: dict, event_id: str):
-    """Run LangChain match analysis, get summary, and append to MongoDB."""
-    # Run analysis
-    match_analysis = generate_langchain_match_analysis(user1, user2)
-    summary = get_match_summary(match_analysis, user_id=str(user1.get('_id')), matched_user_id=str(user2.get('_id')))
-
-    # Prepare match document structure
-    # Try to find existing match doc for this user/event
-    db = current_app.config["DB"]
-    data = request.get_json()
-
-    try:
-        match_obj = Match(
-            user_id=data["user_id"],
-            event_id=data["event_id"],
-            matches=data.get("matches", [])
+def to_match_profile(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a user document into the shape the match analysis expects."""
+    travel_dates = user.get('travel_dates') or ''
+    if isinstance(travel_dates, dict):
+        travel_dates = ' to '.join(str(v) for v in travel_dates.values() if v)
+    return {
+        "_id": str(user.get('_id')),
+        "name": user.get('name', 'Unknown'),
+        "interests": user.get('interests') or [],
+        "location": user.get('location') or '',
+        "travel_dates": str(travel_dates)
+    }
+
+def match_score_ops(user_id, matched_user_id, event_id, score, source="llm"):
+    """Ordered $pull/$push that replace the score for matched_user_id in user_id's match doc for this event."""
+    doc_filter = {"user_id": ObjectId(user_id), "event_id": ObjectId(event_id)}
+    return [
+        UpdateOne(doc_filter, {"$pull": {"matches": {"matched_user_id": ObjectId(matched_user_id)}}}),
+        UpdateOne(
+            doc_filter,
+            {
+                "$push": {"matches": {"matched_user_id": ObjectId(matched_user_id), "score": float(score), "source": source}},
+                "$setOnInsert": {"created_at": datetime.utcnow()}
+            },
+            upsert=True
         )
+    ]
+
+def match_cache_key(user1: Dict[str, Any], user2: Dict[str, Any]) -> str:
+    """Order-independent cache key for a pair at their current profile versions."""
+    (id1, v1), (id2, v2) = sorted([
+        (str(user1.get('_id')), user1.get('profile_version', 0)),
+        (str(user2.get('_id')), user2.get('profile_version', 0))
+    ])
+    return f"{id1}:{id2}:{v1}:{v2}"
+
+def get_or_create_match_analysis(db, user1: Dict[str, Any], user2: Dict[str, Any]) -> MatchAnalysis:
+    """Serve the pair's analysis from match_cache, re-scoring only when either profile changed."""
+    key = match_cache_key(user1, user2)
+    cached = db.match_cache.find_one({"_id": key})
+    if cached:
+        return MatchAnalysis.model_validate(cached["analysis"])
+
+    match_analysis = generate_langchain_match_analysis(to_match_profile(user1), to_match_profile(user2))
+    # Don't pin fallback scores; the LLM may be back next time
+    if match_analysis.analysis_method != "fallback_algorithm":
+        db.match_cache.replace_one(
+            {"_id": key},
+            {"analysis": match_analysis.model_dump(), "created_at": datetime.utcnow()},
+            upsert=True
+        )
+    return match_analysis
+
+def pair_score_ops(user1_id, user2_id, event_ids: List[Any], score, source="llm"):
+    """(matches ops, top_matches ops) recording a symmetric pair score; apply each list in order."""
+    match_ops = []
+    for event_id in event_ids:
+        match_ops += match_score_ops(user1_id, user2_id, event_id, score, source)
+        match_ops += match_score_ops(user2_id, user1_id, event_id, score, source)
+    latest_event = event_ids[-1] if event_ids else None
+    top_ops = (
+        top_matches_ops(user1_id, user2_id, score, latest_event, source)
+        + top_matches_ops(user2_id, user1_id, score, latest_event, source)
+    )
+    return match_ops, top_ops
 
-        match_doc = match_obj.to_dict()
-        result = db.matches.insert_one(match_doc)
-
-        return jsonify({"_id": str(result.inserted_id)}), 201
-    
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
-   
-   
-
+def write_score_ops(db, match_ops, top_ops):
+    """Apply many pairs' score ops in two ordered bulk writes."""
+    if match_ops:
+        db.matches.bulk_write(match_ops, ordered=True)
+    if top_ops:
+        db.top_matches.bulk_write(top_ops, ordered=True)
 
+def store_pair_score(db, user1_id, user2_id, event_ids: List[Any], score, source="llm"):
+    """
+    Record a symmetric pair score under each shared event and in both users' top lists.
 
+    source is "llm" for a full analysis and "local" for a stage-1 ranking score.
+    """
+    write_score_ops(db, *pair_score_ops(user1_id, user2_id, event_ids, score, source))
 
 def save_langchain_match_to_db(db, user1: dict, user2: dict, event_id: str):
-    """Run LangChain match analysis, get summary, and append to MongoDB."""
-    # Run analysis
-    match_analysis = generate_langchain_match_analysis(user1, user2)
+    """Run LangChain match analysis and store the score on both users' match docs for the event."""
+    match_analysis = get_or_create_match_analysis(db, user1, user2)
     summary = get_match_summary(match_analysis, user_id=str(user1.get('_id')), matched_user_id=str(user2.get('_id')))
 
-    # Prepare match document structure
-    # Try to find existing match doc for this user/event
-    db = current_app.config["DB"]
-    data = request.get_json()
-
-    try:
-        match_obj = Match(
-            user_id=data["user_id"],
-            event_id=data["event_id"],
-            matches=data.get("matches", [])
-        )
-
-        match_doc = match_obj.to_dict()
-        result = db.matches.insert_one(match_doc)
-
-        return jsonify({"_id": str(result.inserted_id)}), 201
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 400
-
+    # Compatibility is symmetric, so one analysis scores both directions
+    store_pair_score(db, user1["_id"], user2["_id"], [event_id], summary["match_score"])
 
+    return summary
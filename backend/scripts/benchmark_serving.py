@@ -0,0 +1,142 @@
+"""
+Local throughput benchmark: Flask dev server vs. gunicorn (gunicorn.conf.py).
+
+Starts each server in turn against the MONGO_URI from .env, waits until it
+answers, then drives it with a fixed number of keep-alive client processes for
+a fixed duration and prints requests/s and latency percentiles.
+
+    cd backend
+    python scripts/benchmark_serving.py --path /api/health --concurrency 32 --duration 15
+
+Use a read-only path (e.g. /api/users/<id> or /api/events?location=...) so runs
+are repeatable.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def dev_server_command(port):
+    code = (
+        "from src.app import app, start_background_services\n"
+        "start_background_services(app)\n"
+        f"app.run(debug=True, use_reloader=False, host='127.0.0.1', port={port})\n"
+    )
+    return [sys.executable, "-c", code]
+
+
+def gunicorn_command(port, workers, threads):
+    command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}"]
+    if workers:
+        command += ["--workers", str(workers)]
+    if threads:
+        command += ["--threads", str(threads)]
+    return command
+
+
+def wait_until_ready(port, path, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", path)
+            if conn.getresponse().status < 500:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"server on port {port} did not become ready")
+
+
+def client_loop(args):
+    """One keep-alive connection issuing requests until the deadline; returns latencies and errors."""
+    port, path, start_at, duration = args
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + duration
+    latencies, errors = [], 0
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    while time.time() < deadline:
+        begin = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - begin)
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.close()
+    return latencies, errors
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+def run_load(port, path, concurrency, duration, warmup):
+    with multiprocessing.Pool(concurrency) as pool:
+        if warmup:
+            pool.map(client_loop, [(port, path, time.time() + 0.5, warmup)] * concurrency)
+        start_at = time.time() + 0.5
+        results = pool.map(client_loop, [(port, path, start_at, duration)] * concurrency)
+
+    latencies = sorted(l for lats, _ in results for l in lats)
+    errors = sum(e for _, e in results)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def benchmark(name, command, port, args):
+    env = dict(os.environ, GUNICORN_ACCESS_LOG="")
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port, args.path)
+        stats = run_load(port, args.path, args.concurrency, args.duration, args.warmup)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    return name, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="/api/health")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of measured load per server")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of unmeasured load first")
+    parser.add_argument("--workers", type=int, default=0, help="gunicorn workers (default: gunicorn.conf.py)")
+    parser.add_argument("--threads", type=int, default=0, help="gunicorn threads (default: gunicorn.conf.py)")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    runs = [
+        benchmark("flask dev server", dev_server_command(args.port), args.port, args),
+        benchmark("gunicorn", gunicorn_command(args.port + 1, args.workers, args.threads), args.port + 1, args),
+    ]
+
+    print(f"GET {args.path}  concurrency={args.concurrency}  duration={args.duration:g}s")
+    print(f"{'server':<18}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for name, s in runs:
+        print(f"{name:<18}{s['requests']:>10}{s['errors']:>8}{s['rps']:>10.1f}{s['p50_ms']:>9.2f}{s['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
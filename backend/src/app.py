@@ -4,35 +4,196 @@ from pymongo import MongoClient
 import pymongo
 from dotenv import load_dotenv
 import os
+from datetime import datetime
 from routes.db.user_routes import users_bp
-from routes.activity_routes import activities_bp
+from routes.activity_routes import activities_bp, PROVIDER_CACHE_TTL
 from routes.db.matches_routes import matches_bp
 from routes.db.saved_routes import saved_bp
-from routes.db.itinerary_routes import itins_bp
-from routes.db.event_routes import events_bp
-from routes.db.message_routes import messages_bp
+from routes.db.itinerary_routes import itins_bp, migrateItineraryIds
+from routes.db.event_routes import events_bp, migrateEmbeddedUsers, backfillEventPopularity
+from routes.db.message_routes import messages_bp, backfillConversationIds, backfillConversations
+from app.match_queue import MatchWorker
+from app.similarity import MinHashLSHIndex
+from app.coattendance import CoAttendanceGraph
+from app.event_identity import EventIdentityIndex, CITY_COLLATION
+from app.saved_graph import SavedGraph
+from app.index_refresh import IndexRefresher
+from app.message_bus import MessageBus, LocalFanout, MongoCappedFanout
+from app.profile_cache import ProfileInvalidator, profile_cache
+from app.json_provider import MongoJSONProvider
 import certifi
 
 # Load environment variables from .env
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+# Encodes ObjectId and datetime directly, so routes can return documents as read
+app.json = MongoJSONProvider(app)
+CORS(app, expose_headers=["X-Next-Before", "X-Next-Cursor"])
 
 # Use MongoDB Atlas URI from .env
 mongo_uri = os.getenv("MONGO_URI")
 if not mongo_uri:
     raise ValueError("MONGO_URI not found in .env")
 
-# Connect to MongoDB Atlas
-client = pymongo.MongoClient(mongo_uri, tlsCAFile=certifi.where())
+def connect_db():
+    """Open a MongoClient; each serving process needs its own, created after any fork."""
+    client = pymongo.MongoClient(mongo_uri, tlsCAFile=certifi.where())
+    return client, client["sidequest"]  # Use sidequest database
+
+# `python src/app.py` runs under the reloader, whose watcher process imports this
+# module too but never serves; it skips migrations, index builds and threads
+reloader_watcher = __name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
 
-db = client["sidequest"]  # Use sidequest database
+# Connect to MongoDB Atlas
+client, db = connect_db()
+app.config["MONGO_CLIENT"] = client
 app.config["DB"] = db  # pass DB into app context (can be used in blueprints)
 
 # Ensure email is unique
 db.users.create_index("email", unique=True)
 
+# Backs GET /events location + time range scans and its (time, _id) keyset pagination
+db.events.create_index([("location", 1), ("time", 1), ("_id", 1)])
+
+# Event identity loads a city's events whatever the spelling's case ("SF" and "sf")
+db.events.create_index([("location", 1), ("time", 1)], name="location_ci_time", collation=CITY_COLLATION)
+
+# Attendance lives in its own collection; one row per (event, user)
+db.event_attendance.create_index([("event_id", 1), ("user_id", 1)], unique=True)
+db.event_attendance.create_index([("event_id", 1), ("_id", 1)])
+db.event_attendance.create_index([("user_id", 1), ("_id", 1)])
+
+# Trending: equality on location, sort on attendees, range on day
+db.event_popularity.create_index([("location", 1), ("attendees", -1), ("day", 1)])
+
+# Chat history is read newest-first per conversation, paged by (created_at, _id)
+db.messages.create_index([("conversation_id", 1), ("created_at", -1), ("_id", -1)])
+
+# One summary row per conversation; the inbox reads a user's rows newest-first
+db.conversations.create_index("conversation_id", unique=True)
+db.conversations.create_index([("participants", 1), ("last_at", -1), ("_id", -1)])
+
+# Trips pages list a user's itineraries newest-first by (user_id, _id)
+db.itineraries.create_index([("user_id", 1), ("_id", -1)])
+
+# A profile can be saved once per user
+db.saved.create_index([("user_id", 1), ("saved_user_id", 1)], unique=True)
+
+# Index refreshes read rows written since their last sync; removals leave a short-lived tombstone
+db.users.create_index("updated_at")
+db.saved.create_index("created_at")
+db.event_attendance.create_index("joined_at")
+db.attendance_removals.create_index("removed_at", expireAfterSeconds=24 * 3600)
+
+# One pending match job per user pair; workers claim the oldest first
+db.match_jobs.create_index(
+    [("user_id", 1), ("matched_user_id", 1)],
+    unique=True,
+    partialFilterExpression={"status": "pending"}
+)
+db.match_jobs.create_index([("status", 1), ("created_at", 1)])
+db.match_jobs.create_index(
+    "finished_at",
+    expireAfterSeconds=7 * 24 * 3600,
+    partialFilterExpression={"status": "done"}
+)
+db.matches.create_index([("user_id", 1), ("event_id", 1)])
+
+# Per-user top-K match lists are read by user_id alone
+db.top_matches.create_index("user_id", unique=True)
+
+# Pair analyses are keyed by profile version, so old entries just age out
+db.match_cache.create_index("created_at", expireAfterSeconds=30 * 24 * 3600)
+
+# Cached Google Places / Ticketmaster responses for itinerary edits
+db.provider_cache.create_index("created_at", expireAfterSeconds=PROVIDER_CACHE_TTL)
+
+# In-memory indexes, built here and synced per worker every INDEX_REFRESH_SECONDS
+IN_MEMORY_INDEXES = {
+    # MinHash/LSH index over user interests for /users/<id>/similar
+    "SIMILARITY_INDEX": lambda db: MinHashLSHIndex(
+        include_destination=os.getenv("SIMILAR_USERS_INCLUDE_DESTINATION", "0") == "1"
+    ).build(db),
+    # User-event graph used to rank match candidates
+    "COATTENDANCE_GRAPH": lambda db: CoAttendanceGraph().build(db),
+    # Who-saved-whom graph for mutual saves and friends-of-friends recommendations
+    "SAVED_GRAPH": lambda db: SavedGraph().build(db),
+}
+
+# Data migrations and backfills are safe to re-run; each needs the indexes above
+if not reloader_watcher:
+    migrateEmbeddedUsers(db)
+    backfillEventPopularity(db)
+    backfillConversationIds(db)
+    backfillConversations(db)
+    migrateItineraryIds(db)
+    app.config["INDEXES_BUILT_AT"] = datetime.utcnow()
+    for key, build in IN_MEMORY_INDEXES.items():
+        app.config[key] = build(db)
+
+# Per-city fuzzy event name index so itinerary runs reuse existing events; misses re-read Mongo
+app.config["EVENT_IDENTITY_INDEX"] = EventIdentityIndex()
+
+def start_background_services(app):
+    """
+    Start the per-process threads. Called once in every serving process, after
+    any fork: directly for the dev server, from gunicorn's post_fork hook otherwise.
+    """
+    db = app.config["DB"]
+    cross_worker = os.getenv("MESSAGE_FANOUT", "local") == "mongo"
+
+    # Push channel for /messages/stream; MESSAGE_FANOUT=mongo shares it across workers via a capped collection
+    message_fanout = MongoCappedFanout(db) if cross_worker else LocalFanout()
+    # Every open stream holds a request thread, so keep this below the worker's thread count
+    message_bus = MessageBus(fanout=message_fanout, max_streams=int(os.getenv("MESSAGE_STREAMS_PER_WORKER", "4")))
+    message_bus.start()
+    app.config["MESSAGE_BUS"] = message_bus
+
+    # Profile edits drop the cached profile in every worker, not just the one that wrote it
+    if cross_worker:
+        profile_invalidator = ProfileInvalidator(MongoCappedFanout(db, collection="profile_events", size_bytes=1024 * 1024))
+        profile_invalidator.start()
+        app.config["PROFILE_INVALIDATOR"] = profile_invalidator
+
+    # Background match computation, bounded by MATCH_WORKERS threads
+    match_worker = MatchWorker(db, max_workers=int(os.getenv("MATCH_WORKERS", "4")))
+    match_worker.start()
+    app.config["MATCH_WORKER"] = match_worker
+
+    # Pick up saves, attendance and profile edits written by other workers (0 = never).
+    # Catch up once right away: a re-forked worker inherits indexes as old as the master.
+    index_refresher = IndexRefresher(app, db, IN_MEMORY_INDEXES, since=app.config["INDEXES_BUILT_AT"],
+                                     interval=float(os.getenv("INDEX_REFRESH_SECONDS", "60")))
+    index_refresher.refresh()
+    if index_refresher.interval > 0:
+        index_refresher.start()
+    app.config["INDEX_REFRESHER"] = index_refresher
+
+def stop_background_services(app):
+    """Let in-flight match jobs finish and stop tailing; used on graceful shutdown."""
+    match_worker = app.config.pop("MATCH_WORKER", None)
+    if match_worker is not None:
+        match_worker.stop(wait=True)
+    message_bus = app.config.pop("MESSAGE_BUS", None)
+    if message_bus is not None:
+        message_bus.stop()
+    profile_invalidator = app.config.pop("PROFILE_INVALIDATOR", None)
+    if profile_invalidator is not None:
+        profile_invalidator.stop()
+    index_refresher = app.config.pop("INDEX_REFRESHER", None)
+    if index_refresher is not None:
+        index_refresher.stop()
+
+def init_worker(app):
+    """Give a freshly forked worker its own MongoClient and background threads."""
+    client, db = connect_db()
+    app.config["MONGO_CLIENT"] = client
+    app.config["DB"] = db
+    # Nothing the master cached while preloading is known to be current
+    profile_cache.clear()
+    start_background_services(app)
+
 # Register the blueprints
 app.register_blueprint(users_bp, url_prefix="/api")
 app.register_blueprint(activities_bp, url_prefix="/api")
@@ -42,6 +203,13 @@ app.register_blueprint(itins_bp, url_prefix="/api")
 app.register_blueprint(events_bp, url_prefix="/api")
 app.register_blueprint(messages_bp, url_prefix="/api")
 
+@app.route("/api/health", methods=["GET"])
+def health():
+    return jsonify({"status": "ok", "pid": os.getpid()}), 200
+
 if __name__ == "__main__":
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    if not reloader_watcher:
+        start_background_services(app)
     app.run(debug=True, host='0.0.0.0', port=8000)
 
@@ -0,0 +1,91 @@
+import unittest
+from datetime import datetime, timezone
+from app.coattendance import CoAttendanceGraph, _csr
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+class TestCsr(unittest.TestCase):
+    def test_packs_rows_in_order(self):
+        indptr, indices = _csr(3, [(0, 1), (0, 2), (2, 0)])
+        self.assertEqual(list(indptr), [0, 2, 2, 3])
+        self.assertEqual(list(indices), [1, 2, 0])
+
+    def test_empty(self):
+        indptr, indices = _csr(2, [])
+        self.assertEqual(list(indptr), [0, 0, 0])
+        self.assertEqual(list(indices), [])
+
+class TestCoAttendanceGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = CoAttendanceGraph(compact_threshold=3)
+
+    def test_compaction_preserves_edges(self):
+        edges = [("e1", "alice"), ("e1", "bob"), ("e2", "alice"), ("e2", "carol"), ("e3", "bob")]
+        for event_id, user_id in edges:
+            self.graph.add_attendance(event_id, user_id, NOW)
+        # Three adds fold the overlay into the CSR arrays; the rest stay in the overlay
+        self.assertEqual(self.graph._pending, 2)
+        self.graph._compact()
+        self.assertEqual(self.graph._pending, 0)
+        self.assertEqual(sorted(self.graph.events_for_user("alice")), ["e1", "e2"])
+        self.assertEqual(sorted(self.graph.events_for_user("bob")), ["e1", "e3"])
+        self.assertEqual(self.graph.events_for_user("carol"), ["e2"])
+
+    def test_duplicate_attendance_is_ignored(self):
+        self.assertTrue(self.graph.add_attendance("e1", "alice", NOW))
+        self.assertFalse(self.graph.add_attendance("e1", "alice", NOW))
+        self.graph._compact()
+        self.assertFalse(self.graph.add_attendance("e1", "alice", NOW))
+
+    def test_rank_candidates_orders_by_shared_then_recency(self):
+        recent = datetime(2024, 5, 30, tzinfo=timezone.utc)
+        old = datetime(2023, 1, 1, tzinfo=timezone.utc)
+        self.graph.add_attendance("recent", "alice", recent)
+        self.graph.add_attendance("old", "alice", old)
+        self.graph.add_attendance("recent", "bob", recent)
+        self.graph.add_attendance("old", "carol", old)
+        self.graph.add_attendance("recent", "dave", recent)
+        self.graph.add_attendance("old", "dave", old)
+
+        ranked = self.graph.rank_candidates("alice", now=NOW.timestamp())
+        self.assertEqual([r["user_id"] for r in ranked], ["dave", "bob", "carol"])
+        self.assertEqual(ranked[0]["shared_events"], 2)
+        self.assertGreater(ranked[1]["recency_score"], ranked[2]["recency_score"])
+        self.assertEqual(ranked[1]["last_shared_at"], "2024-05-30T00:00")
+
+    def test_rank_candidates_limit_and_unknown_user(self):
+        for user_id in ("alice", "bob", "carol"):
+            self.graph.add_attendance("e1", user_id, NOW)
+        self.assertEqual(len(self.graph.rank_candidates("alice", limit=1)), 1)
+        self.assertEqual(self.graph.rank_candidates("nobody"), [])
+
+    def test_remove_attendance_from_overlay_and_csr(self):
+        self.graph.add_attendance("e1", "alice", NOW)
+        self.graph.add_attendance("e1", "bob", NOW)
+        self.graph._compact()
+        self.graph.add_attendance("e2", "alice", NOW)
+
+        self.assertTrue(self.graph.remove_attendance("e2", "alice"))
+        self.assertTrue(self.graph.remove_attendance("e1", "bob"))
+        self.assertFalse(self.graph.remove_attendance("e1", "bob"))
+        self.assertFalse(self.graph.remove_attendance("missing", "alice"))
+
+        self.assertEqual(self.graph.events_for_user("alice"), ["e1"])
+        self.assertEqual(self.graph.events_for_user("bob"), [])
+        self.assertEqual(self.graph.rank_candidates("alice"), [])
+
+        self.graph._compact()
+        self.assertEqual(self.graph.events_for_user("bob"), [])
+        self.assertEqual(self.graph.events_for_user("alice"), ["e1"])
+
+    def test_re_adding_removed_attendance(self):
+        self.graph.add_attendance("e1", "alice", NOW)
+        self.graph.add_attendance("e1", "bob", NOW)
+        self.graph._compact()
+        self.graph.remove_attendance("e1", "bob")
+        self.assertTrue(self.graph.add_attendance("e1", "bob", NOW))
+        self.assertEqual(self.graph.events_for_user("bob"), ["e1"])
+        self.assertEqual([r["user_id"] for r in self.graph.rank_candidates("alice")], ["bob"])
+
+if __name__ == "__main__":
+    unittest.main()
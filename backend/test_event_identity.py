@@ -0,0 +1,103 @@
+import unittest
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.event_identity import EventIdentityIndex, normalize_name
+
+class FakeCursor:
+    def __init__(self, docs, query):
+        self.docs = docs
+        self.query = query
+        self.case_insensitive = False
+
+    def collation(self, collation):
+        self.case_insensitive = collation.get("strength") in (1, 2)
+        return self
+
+    def __iter__(self):
+        fold = str.casefold if self.case_insensitive else (lambda s: s)
+        for doc in self.docs:
+            if fold(doc["location"]) != fold(self.query["location"]):
+                continue
+            time_range = self.query.get("time", {})
+            if "$gte" in time_range and doc["time"] < time_range["$gte"]:
+                continue
+            if "$lt" in time_range and doc["time"] >= time_range["$lt"]:
+                continue
+            yield doc
+
+class FakeEvents:
+    def __init__(self):
+        self.docs = []
+
+    def insert(self, name, location, time):
+        doc = {"_id": ObjectId(), "name": name, "location": location, "time": time}
+        self.docs.append(doc)
+        return str(doc["_id"])
+
+    def find(self, query, projection=None):
+        return FakeCursor(self.docs, query)
+
+class FakeDB:
+    def __init__(self):
+        self.events = FakeEvents()
+
+NOON = datetime(2024, 6, 1, 12, 0)
+
+class TestEventIdentityIndex(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDB()
+        self.index = EventIdentityIndex()
+
+    def resolve(self, name, location="San Francisco", time=NOON):
+        return self.index.resolve(self.db, name, location, time)
+
+    def test_normalize_name_drops_filler_and_accents(self):
+        self.assertEqual(normalize_name("The Café at Alcatraz Island Tour"), "cafe alcatraz island")
+
+    def test_exact_and_filler_variants(self):
+        event_id = self.db.events.insert("Alcatraz Island", "San Francisco", NOON)
+        self.assertEqual(self.resolve("Alcatraz Island Tour"), event_id)
+        self.assertEqual(self.resolve("alcatraz island"), event_id)
+
+    def test_fuzzy_variants(self):
+        hike = self.db.events.insert("Twin Peaks", "San Francisco", NOON)
+        market = self.db.events.insert("Ferry Building Market Place", "San Francisco", NOON)
+        self.assertEqual(self.resolve("Twin Peaks Hike"), hike)
+        self.assertEqual(self.resolve("Ferry Building Marketplace"), market)
+
+    def test_numbers_must_match(self):
+        self.db.events.insert("Pier 39", "San Francisco", NOON)
+        self.assertIsNone(self.resolve("Pier 33"))
+
+    def test_different_words_need_a_close_spelling(self):
+        self.db.events.insert("Dinner at Nopa", "San Francisco", NOON)
+        self.assertIsNone(self.resolve("Dinner at Nopalito"))
+
+    def test_outside_window_is_a_new_event(self):
+        self.db.events.insert("Dinner at Nopa", "San Francisco", NOON)
+        self.assertIsNone(self.resolve("Dinner at Nopa", time=NOON + timedelta(hours=8)))
+
+    def test_city_case_does_not_split_buckets(self):
+        lower = self.db.events.insert("Coit Tower", "san francisco", NOON)
+        upper = self.db.events.insert("Lombard Street", "San Francisco", NOON)
+        self.assertEqual(self.resolve("Lombard Street", location="san francisco"), upper)
+        self.assertEqual(self.resolve("Coit Tower", location=" SAN FRANCISCO"), lower)
+
+    def test_miss_rereads_events_from_other_workers(self):
+        self.assertIsNone(self.resolve("Exploratorium"))
+        event_id = self.db.events.insert("Exploratorium", "San Francisco", NOON)
+        self.assertEqual(self.resolve("The Exploratorium"), event_id)
+
+    def test_add_indexes_new_events(self):
+        self.resolve("Coit Tower")
+        event_id = str(ObjectId())
+        self.index.add(event_id, "Coit Tower", "san francisco", NOON)
+        self.assertEqual(self.resolve("Coit Tower Visit"), event_id)
+
+    def test_ties_go_to_the_closest_event(self):
+        self.db.events.insert("Golden Gate Bridge", "San Francisco", NOON + timedelta(minutes=90))
+        closer = self.db.events.insert("Golden Gate Bridge", "San Francisco", NOON + timedelta(minutes=30))
+        self.assertEqual(self.resolve("Golden Gate Bridge Walk"), closer)
+
+if __name__ == "__main__":
+    unittest.main()
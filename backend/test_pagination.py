@@ -0,0 +1,38 @@
+import unittest
+from datetime import datetime
+from bson import ObjectId
+from app.pagination import encode_cursor, decode_cursor, keyset_filter, clamp_limit
+
+class TestCursors(unittest.TestCase):
+    def test_datetime_round_trip(self):
+        last_id = ObjectId()
+        value = datetime(2024, 6, 1, 18, 30, 15, 123000)
+        self.assertEqual(decode_cursor(encode_cursor(value, last_id)), (value, last_id))
+
+    def test_plain_value_round_trip(self):
+        last_id = ObjectId()
+        for value in (42, 0.5, "Pier 39", None):
+            self.assertEqual(decode_cursor(encode_cursor(value, last_id)), (value, last_id))
+
+    def test_malformed_cursor(self):
+        for cursor in ("not-base64!", encode_cursor(1, "nope")[:-4], ""):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+class TestKeysetFilter(unittest.TestCase):
+    def test_ascending_and_descending(self):
+        last_id = ObjectId()
+        self.assertEqual(keyset_filter("time", 5, last_id), {"$or": [
+            {"time": {"$gt": 5}},
+            {"time": 5, "_id": {"$gt": last_id}}
+        ]})
+        self.assertEqual(keyset_filter("time", 5, last_id, descending=True)["$or"][0], {"time": {"$lt": 5}})
+
+    def test_clamp_limit(self):
+        self.assertEqual(clamp_limit(None), 50)
+        self.assertEqual(clamp_limit(0), 50)
+        self.assertEqual(clamp_limit(10), 10)
+        self.assertEqual(clamp_limit(1000), 200)
+
+if __name__ == "__main__":
+    unittest.main()
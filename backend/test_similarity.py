@@ -0,0 +1,48 @@
+import unittest
+from app.similarity import MinHashLSHIndex
+
+class TestMinHashLSHIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = MinHashLSHIndex()
+
+    def test_rejects_uneven_bands(self):
+        with self.assertRaises(ValueError):
+            MinHashLSHIndex(num_perm=10, bands=3)
+
+    def test_signature_is_deterministic(self):
+        other = MinHashLSHIndex()
+        tokens = {"i:hiking", "i:food"}
+        self.assertEqual(self.index.signature(tokens), other.signature(tokens))
+        self.assertEqual(len(self.index.signature(tokens)), 64)
+
+    def test_tokens_normalize_interests(self):
+        tokens = self.index.tokens_for({"interests": [" Hiking", "hiking", ""], "location": "Paris"})
+        self.assertEqual(tokens, {"i:hiking"})
+        with_destination = MinHashLSHIndex(include_destination=True)
+        self.assertIn("d:paris", with_destination.tokens_for({"interests": [], "location": " Paris "}))
+
+    def test_query_ranks_closest_first(self):
+        self.index.update({"_id": "a", "interests": ["hiking", "food", "museums", "jazz"]})
+        self.index.update({"_id": "b", "interests": ["hiking", "food", "museums", "jazz"]})
+        self.index.update({"_id": "c", "interests": ["hiking", "food", "surfing", "wine"]})
+        self.index.update({"_id": "d", "interests": ["chess"]})
+
+        results = self.index.query("a")
+        self.assertEqual(results[0], ("b", 1.0))
+        self.assertNotIn("d", [user_id for user_id, _ in results])
+        self.assertEqual(self.index.query("missing"), [])
+
+    def test_update_and_remove_reindex(self):
+        self.index.update({"_id": "a", "interests": ["hiking"]})
+        self.index.update({"_id": "b", "interests": ["hiking"]})
+        self.index.update({"_id": "b", "interests": ["chess"]})
+        self.assertEqual(self.index.query("a"), [])
+
+        self.index.update({"_id": "b", "interests": []})
+        self.assertEqual(len(self.index), 1)
+        self.index.remove("a")
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(sum(len(bucket) for bucket in self.index._buckets), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,11 @@
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useState } from 'react';
 import TabNavigation from '../components/TabNavigation';
 import { useAuth0 } from '@auth0/auth0-react';
 import api from '../api';
 
 type SavedUser = { id: string; name: string };
 type Message = {
+  _id?: string;
   from_user_id: string;
   to_user_id: string;
   text: string;
@@ -34,19 +35,55 @@ const MessagesPage = () => {
     }
   }, [selectedUserId, myUserId]);
 
+  // Messages can arrive twice (send response and stream echo); keep one copy
+  const appendMessage = useCallback((msg: Message) => {
+    setMessages((prev) =>
+      prev.some((m) => m._id === msg._id) ? prev : [...prev, msg]
+    );
+  }, []);
+
+  // Append messages pushed over the server-sent events stream
+  useEffect(() => {
+    if (!selectedUserId || !myUserId) return;
+    const source = new EventSource(
+      `${api.defaults.baseURL}messages/stream/${encodeURIComponent(myUserId)}`
+    );
+    source.addEventListener('message', (e) => {
+      const msg: Message = JSON.parse((e as MessageEvent).data).message;
+      const inChat =
+        (msg.from_user_id === myUserId && msg.to_user_id === selectedUserId) ||
+        (msg.from_user_id === selectedUserId && msg.to_user_id === myUserId);
+      if (!inChat) return;
+      appendMessage(msg);
+    });
+    // The server refuses streams with 503 when its stream slots are full; poll instead
+    let poll: number | undefined;
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && poll === undefined) {
+        poll = window.setInterval(() => {
+          api.get(`/messages/${myUserId}/${selectedUserId}`).then((res) => {
+            setMessages(res.data);
+          });
+        }, 10000);
+      }
+    };
+    return () => {
+      source.close();
+      window.clearInterval(poll);
+    };
+  }, [selectedUserId, myUserId, appendMessage]);
+
   // Send a message to backend
   const sendMessage = async () => {
     if (!input.trim() || !selectedUserId || !myUserId) return;
-    await api.post('/messages', {
+    const res = await api.post('/messages', {
       from_user_id: myUserId,
       to_user_id: selectedUserId,
       text: input,
     });
     setInput('');
-    // Re-fetch messages
-    api.get(`/messages/${myUserId}/${selectedUserId}`).then((res) => {
-      setMessages(res.data);
-    });
+    // Show the stored message right away, even if the stream is down
+    appendMessage(res.data.data);
   };
 
   const selectedUser = savedUsers.find((u) => u.id === selectedUserId);